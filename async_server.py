@@ -0,0 +1,299 @@
+"""The chess HTTP API on an asyncio event loop, with moves pushed to spectators as server-sent events.
+
+Every route of server.py is served as before, run on a worker thread so the loop never waits on
+a game lock. Two more routes stream a game instead of answering once:
+    GET /events              the shared game
+    GET /games/<id>/events   a hosted game
+Each sends the position when it opens and again after every move, as
+    event: position
+    data: {"fen": ..., "move": "e2e4", "ply": 1, ...}
+and a hosted game's stream ends with an "event: closed" once the game is deleted.
+
+Serve it with no board window:
+    python async_server.py [--host HOST] [--port PORT] [--engine white|black]
+or set CHESS_HTTP=asyncio for play.py.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+import engine
+import metrics
+import pieces
+import server
+
+# Bytes a spectator may fall behind by before it is dropped rather than buffered for
+MAX_BACKLOG = 1 << 20
+# Seconds between comment lines on idle streams, so dead connections are noticed
+HEARTBEAT = 15.0
+# Largest request body accepted
+MAX_BODY = 1 << 16
+_STREAM_HEADERS = (b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                   b'Connection: close\r\n\r\n')
+
+
+def _event(name, body):
+    return f'event: {name}\ndata: {json.dumps(body, separators=(",", ":"))}\n\n'.encode()
+
+
+def _stream_key(method, path):
+    # (True, game ID or None for the shared game) for a stream route, else (False, None)
+    if method == 'GET':
+        if path == '/events':
+            return True, None
+        parts = path.split('/')
+        if len(parts) == 4 and parts[1] == 'games' and parts[3] == 'events' and parts[2]:
+            return True, parts[2]
+    return False, None
+
+
+def snapshot(game_id):
+    # The body of a position event for the shared game (game_id None) or a hosted game, or None
+    # when there is no such game
+    if game_id is None:
+        with server.lock:
+            body = server.position_json(server.state)
+            moves = server.state.moves
+            body['move'] = pieces.uci(moves[-1]) if moves else None
+            body['ply'] = len(moves)
+        return body
+    session = server.sessions.get(game_id)
+    if session is None:
+        return None
+    with session.lock:
+        body = server.session_json(session)
+        body['move'] = pieces.uci(pieces.decode_move(session.moves[-1])) if session.moves else None
+        body['ply'] = len(session.moves)
+    return body
+
+
+async def _read_request(reader):
+    # (method, target, headers, body) of the next request, or None once the client is gone
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, target, _ = line.decode('latin-1').split(' ', 2)
+    headers = []
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers.append((name.strip(), value.strip()))
+    length = int(dict((name.lower(), value) for name, value in headers).get('content-length', 0))
+    if length > MAX_BODY:
+        raise ValueError('request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+class StreamServer:
+    # Has the serve_forever() and shutdown() of a werkzeug server, so play.py can run either.
+    # engine_color, True for white or False for black, has the computer answer that side's turn in
+    # the shared game; its searches run in a separate process so the loop is never held up.
+
+    def __init__(self, host='0.0.0.0', port=4444, engine_color=None, engine_time=1.0, tablebase_directory=None):
+        self.host = host
+        self.port = port
+        self.engine_color = engine_color
+        self.engine_time = engine_time
+        self.tablebase_directory = tablebase_directory
+        # Open spectator streams by game ID, None for the shared game
+        self.channels = {}
+        # Every open connection and the task serving it, to close them on shutdown
+        self._connections = {}
+        self.loop = None
+        self.ready = threading.Event()
+        self._stopped = None
+        self._engine_pool = None
+        # Set whenever the shared game changes, to wake the engine task
+        self._wake = None
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    def shutdown(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        listening = await asyncio.start_server(self.handle, self.host, self.port, backlog=1024)
+        self.port = listening.sockets[0].getsockname()[1]
+        if self.engine_color is not None:
+            # Spawned rather than forked: a forked worker would hold copies of the open sockets, and
+            # a spectator's stream would not see the end of a closed connection
+            self._engine_pool = ProcessPoolExecutor(1, multiprocessing.get_context('spawn'),
+                                                    initializer=engine._start_worker,
+                                                    initargs=(16, self.tablebase_directory))
+        server.listeners.append(self.changed)
+        tasks = [asyncio.create_task(self.heartbeat())]
+        if self.engine_color is not None:
+            self._wake = asyncio.Event()
+            self._wake.set()
+            tasks.append(asyncio.create_task(self.think()))
+        self.ready.set()
+        try:
+            await self._stopped.wait()
+        finally:
+            server.listeners.remove(self.changed)
+            for task in tasks:
+                task.cancel()
+            listening.close()
+            for writer in list(self._connections):
+                writer.close()
+            if self._connections:
+                await asyncio.wait(list(self._connections.values()), timeout=1.0)
+            if self._engine_pool is not None:
+                self._engine_pool.shutdown(cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except ValueError:
+                    writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                parts = urlsplit(target)
+                stream, game_id = _stream_key(method, parts.path)
+                if stream:
+                    await self.stream(reader, writer, game_id)
+                    break
+                # The WSGI app takes the game locks, so it runs on a worker thread
+                response = await self.loop.run_in_executor(None, self.call_app, method, parts, headers, body)
+                writer.write(response)
+                await writer.drain()
+                if any(name.lower() == 'connection' and value.lower() == 'close' for name, value in headers):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self._connections[writer]
+            writer.close()
+
+    def call_app(self, method, parts, headers, body):
+        # One request through server.app; returns the raw response
+        environ = EnvironBuilder(path=parts.path, query_string=parts.query, method=method, headers=headers,
+                                 data=body, environ_base={'SERVER_NAME': self.host,
+                                                          'SERVER_PORT': str(self.port)}).get_environ()
+        app_iter, status, response_headers = run_wsgi_app(server.app, environ, buffered=True)
+        try:
+            data = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        response_headers['Content-Length'] = str(len(data))
+        head = f'HTTP/1.1 {status}\r\n' + ''.join(f'{name}: {value}\r\n' for name, value in response_headers.items())
+        return head.encode('latin-1') + b'\r\n' + data
+
+    async def stream(self, reader, writer, game_id):
+        body = await self.loop.run_in_executor(None, snapshot, game_id)
+        if body is None:
+            data = json.dumps({'error': f'no such game: {game_id}'}).encode()
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: %d\r\nConnection: close\r\n\r\n' % len(data) + data)
+            return
+        writer.write(_STREAM_HEADERS + _event('position', body))
+        channel = self.channels.setdefault(game_id, set())
+        channel.add(writer)
+        try:
+            # Nothing more is expected from a spectator; this returns when it hangs up
+            while await reader.read(4096):
+                pass
+        finally:
+            channel.discard(writer)
+            if not channel and self.channels.get(game_id) is channel:
+                del self.channels[game_id]
+
+    def changed(self, game_id):
+        # server.listeners callback, on the thread that changed the game. The event is built here,
+        # once, and the loop only copies the same bytes to every spectator.
+        if game_id in self.channels:
+            body = snapshot(game_id)
+            data = _event('position', body) if body is not None else _event('closed', {'id': game_id})
+            self.loop.call_soon_threadsafe(self.publish, game_id, data, body is None)
+        if game_id is None and self._wake is not None:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    def publish(self, game_id, data, last=False):
+        channel = self.channels.get(game_id, ())
+        for writer in list(channel):
+            # A spectator that stops reading is cut off instead of growing its buffer without bound
+            if last or writer.transport.get_write_buffer_size() > MAX_BACKLOG:
+                if last:
+                    writer.write(data)
+                writer.close()
+                channel.discard(writer)
+            else:
+                writer.write(data)
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT)
+            for game_id in list(self.channels):
+                self.publish(game_id, b': keep-alive\n\n')
+
+    async def think(self):
+        # The one task that answers for the engine. The wake-up is cleared before the turn is looked
+        # at, so a change made while it looks, or while it searches, has it look again.
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            turn = await self.loop.run_in_executor(None, self._engine_turn)
+            if turn is None:
+                continue
+            position, ply, move = turn
+            if move is None:
+                result = await self.loop.run_in_executor(self._engine_pool, engine._search_position,
+                                                         position, self.engine_time)
+                move = result.move
+            await self.loop.run_in_executor(None, self._engine_apply, position, ply, move)
+
+    def _engine_turn(self):
+        # (position copy, ply, book move or None) while the engine is to move, else None
+        with server.lock:
+            state = server.state
+            if state.white_to_move != self.engine_color or state.game_over:
+                return None
+            position, ply = state.position.copy(history=True), len(state.moves)
+        book_move = server.opening_book.choose(position) if server.opening_book else None
+        return position, ply, book_move
+
+    def _engine_apply(self, position, ply, move):
+        # The move is dropped if the game changed during the search, and the next turn is looked up
+        with server.lock:
+            state = server.state
+            if len(state.moves) != ply or state.position.key != position.key or move is None:
+                return
+            state.apply(move)
+        server.notify()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=4444)
+    parser.add_argument('--engine', choices=('white', 'black'), default=os.environ.get('CHESS_ENGINE') or None,
+                        help='let the computer play this side of the shared game')
+    parser.add_argument('--engine-time', type=float, default=float(os.environ.get('CHESS_ENGINE_TIME', '1.0')))
+    args = parser.parse_args(argv)
+    metrics.setup()
+    color = {'white': True, 'black': False}.get(args.engine)
+    StreamServer(args.host, args.port, color, args.engine_time, os.environ.get('CHESS_TABLEBASES')).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
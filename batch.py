@@ -0,0 +1,159 @@
+"""Evaluation, check and move counts for many positions at once, with NumPy.
+
+A batch is an (N, 64) int8 array of the piece codes from pieces.py in pieces.SQUARES order,
+row 0 being the eighth rank, plus optional per-position side to move, castling rights and
+en-passant square (a mailbox index, as Position.ep). encode() builds one from Position objects.
+"""
+import numpy as np
+
+import pieces
+from engine import _PIECE_SQUARE_VALUE
+from pieces import EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, OFFBOARD
+
+SQUARES = np.array(pieces.SQUARES)
+# Square index seen from the other side of the board
+_MIRROR = np.array([(7 - i // 8) * 8 + i % 8 for i in range(64)])
+_MAILBOX_MIRROR = np.zeros(120, dtype=np.int64)
+_MAILBOX_MIRROR[SQUARES] = SQUARES[_MIRROR]
+# Material plus placement of each piece code (offset by 6) on each of the 64 squares
+_VALUES = np.array(_PIECE_SQUARE_VALUE)[:, SQUARES]
+# The mailbox square one step along an offset, or the off-board square 0 once a ray leaves the box
+_STEP = {offset: np.array([sq + offset if 0 <= sq + offset < 120 else 0 for sq in range(120)])
+         for offset in pieces.KING_OFFSETS}
+
+
+def encode(positions):
+    # (boards, white_to_move, castling, ep) arrays for a sequence of Position objects
+    boards = np.array([np.frombuffer(position.squares, dtype=np.int8)[SQUARES] for position in positions],
+                      dtype=np.int8).reshape(-1, 64)
+    white_to_move = np.array([position.white_to_move for position in positions], dtype=bool)
+    castling = np.array([position.castling for position in positions], dtype=np.int8)
+    ep = np.array([position.ep for position in positions], dtype=np.int64)
+    return boards, white_to_move, castling, ep
+
+
+def _oriented(boards, white_to_move, castling=None, ep=None):
+    # Mailboxes, one column per position, with the side to move playing up the board as white,
+    # its castling bits moved to the white ones and the en-passant square mirrored to match
+    boards = np.asarray(boards, dtype=np.int8)
+    n = len(boards)
+    white_to_move = np.ones(n, dtype=bool) if white_to_move is None else np.asarray(white_to_move, dtype=bool)
+    black = ~white_to_move
+    oriented = boards.copy()
+    oriented[black] = -boards[black][:, _MIRROR]
+    mailbox = np.full((120, n), OFFBOARD, dtype=np.int8)
+    mailbox[SQUARES] = oriented.T
+
+    rights = np.zeros(n, dtype=np.int64) if castling is None else np.asarray(castling, dtype=np.int64)
+    rights = np.where(black, rights >> 2, rights) & 3
+    ep = np.zeros(n, dtype=np.int64) if ep is None else np.asarray(ep, dtype=np.int64)
+    ep = np.where(black & (ep != 0), _MAILBOX_MIRROR[ep], ep)
+    return mailbox, rights, ep
+
+
+def _attacked(mailbox, targets):
+    # Whether each position's target square is attacked by the black pieces, looking outwards from
+    # the target as pieces.is_square_attacked does
+    columns = np.arange(mailbox.shape[1])
+    attacked = np.zeros(mailbox.shape[1], dtype=bool)
+    for offset in (-9, -11):
+        attacked |= mailbox[targets + offset, columns] == -PAWN
+    for offset in pieces.KNIGHT_OFFSETS:
+        attacked |= mailbox[targets + offset, columns] == -KNIGHT
+    for offset in pieces.KING_OFFSETS:
+        attacked |= mailbox[targets + offset, columns] == -KING
+    for offsets, kind in ((pieces.BISHOP_OFFSETS, -BISHOP), (pieces.ROOK_OFFSETS, -ROOK)):
+        for offset in offsets:
+            step, at = _STEP[offset], targets
+            open_ = np.ones(mailbox.shape[1], dtype=bool)
+            while open_.any():
+                at = step[at]
+                piece = mailbox[at, columns]
+                attacked |= open_ & ((piece == kind) | (piece == -QUEEN))
+                open_ &= piece == EMPTY
+    return attacked
+
+
+def _in_check(mailbox):
+    kings = SQUARES[np.argmax(mailbox[SQUARES] == KING, axis=0)]
+    return _attacked(mailbox, kings)
+
+
+def _move_counts(mailbox, rights, ep):
+    # Pseudo-legal moves of the white pieces, counted the way Position.pseudo_legal_moves lists them
+    n = mailbox.shape[1]
+    board = mailbox[SQUARES]
+    # Pawn moves are tallied per square in bytes and summed once
+    tally = np.zeros((64, n), dtype=np.uint8)
+    pawns = board == PAWN
+    single = pawns & (mailbox[SQUARES - 10] == EMPTY)
+    tally += single
+    tally[48:] += single[48:] & (mailbox[SQUARES[48:] - 20] == EMPTY)
+    captures = [pawns & (mailbox[SQUARES + offset] < 0) for offset in (-11, -9)]
+    for capture in captures:
+        tally += capture
+    # The first two rows hold the only pawns that can promote; each promotion is four moves
+    promoting = single[:16].view(np.uint8) + captures[0][:16] + captures[1][:16]
+    tally[:16] += promoting * np.uint8(3)
+    counts = tally.sum(axis=0, dtype=np.int64)
+
+    # The other pieces are few, so they are moved from a flat list of (square, position) pairs.
+    # A slider's ray is dropped once blocked, and a queen is walked as both a bishop and a rook.
+    for kind, offsets in ((KNIGHT, pieces.KNIGHT_OFFSETS), (KING, pieces.KING_OFFSETS)):
+        rows, columns = np.nonzero(board == kind)
+        at = SQUARES[rows]
+        for offset in offsets:
+            counts += np.bincount(columns[mailbox[at + offset, columns] <= EMPTY], minlength=n)
+    queens = board == QUEEN
+    for kind in (BISHOP, ROOK):
+        rows, columns = np.nonzero((board == kind) | queens)
+        for offset in pieces.SLIDER_OFFSETS[kind]:
+            step, at, owners = _STEP[offset], SQUARES[rows], columns
+            while len(at):
+                at = step[at]
+                target = mailbox[at, owners]
+                counts += np.bincount(owners[target <= EMPTY], minlength=n)
+                open_ = target == EMPTY
+                at, owners = at[open_], owners[open_]
+
+    columns = np.arange(n)
+    en_passant = (ep > 40) & (ep < 49)
+    for offset in (9, 11):
+        counts += en_passant & (mailbox[np.where(en_passant, ep + offset, 0), columns] == PAWN)
+
+    # Castling, with the same conditions as Position._castling_moves
+    home = (mailbox[95] == KING) & (rights != 0)
+    if home.any():
+        home &= ~_attacked(mailbox, np.full(n, 95))
+        counts += home & (rights & 1 != 0) & (mailbox[96] == EMPTY) & (mailbox[97] == EMPTY) & \
+            (mailbox[98] == ROOK) & ~_attacked(mailbox, np.full(n, 96))
+        counts += home & (rights & 2 != 0) & (mailbox[94] == EMPTY) & (mailbox[93] == EMPTY) & \
+            (mailbox[92] == EMPTY) & (mailbox[91] == ROOK) & ~_attacked(mailbox, np.full(n, 94))
+    return counts
+
+
+def _scores(mailbox):
+    return _VALUES[mailbox[SQUARES] + 6, np.arange(64)[:, None]].sum(axis=0)
+
+
+def evaluate(boards, white_to_move=None):
+    # Material and piece-square score for the side to move, as engine.evaluate
+    mailbox, _, _ = _oriented(boards, white_to_move)
+    return _scores(mailbox)
+
+
+def in_check(boards, white_to_move=None):
+    mailbox, _, _ = _oriented(boards, white_to_move)
+    return _in_check(mailbox)
+
+
+def move_counts(boards, white_to_move=None, castling=None, ep=None):
+    # Number of pseudo-legal moves for the side to move; no castling or en passant unless given
+    mailbox, rights, ep = _oriented(boards, white_to_move, castling, ep)
+    return _move_counts(mailbox, rights, ep)
+
+
+def analyse(boards, white_to_move=None, castling=None, ep=None):
+    # (scores, in-check flags, pseudo-legal move counts)
+    mailbox, rights, ep = _oriented(boards, white_to_move, castling, ep)
+    return _scores(mailbox), _in_check(mailbox), _move_counts(mailbox, rights, ep)
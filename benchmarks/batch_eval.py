@@ -0,0 +1,60 @@
+"""Positions per second through batch.analyse against the scalar path it replaces.
+
+The scalar path is engine.evaluate, Position.in_check and Position.pseudo_legal_moves, one
+position at a time. Positions come from random games out of the perft test positions.
+Run from the repository root:  python -m benchmarks.batch_eval
+"""
+import random
+import time
+
+import numpy as np
+
+import batch
+import engine
+import pieces
+from perft import POSITIONS
+
+BATCH = 100000
+# The batch is fed in chunks of this many positions to bound its temporaries
+CHUNK = 20000
+SCALAR = 5000
+
+
+def sample_positions(count, seed=7):
+    rng = random.Random(seed)
+    positions = []
+    fens = [fen for fen, _ in POSITIONS.values()]
+    while len(positions) < count:
+        position = pieces.Position.from_fen(rng.choice(fens))
+        for _ in range(rng.randint(1, 60)):
+            legal = position.legal_moves()
+            if not legal:
+                break
+            position.push(rng.choice(legal))
+            positions.append(position.copy())
+    return positions[:count]
+
+
+def main():
+    positions = sample_positions(SCALAR)
+    start = time.perf_counter()
+    for position in positions:
+        engine.evaluate(position), position.in_check(), len(position.pseudo_legal_moves())
+    scalar = len(positions) / (time.perf_counter() - start)
+
+    arrays = batch.encode(positions)
+    repeat = BATCH // len(positions)
+    boards, white_to_move, castling, ep = (np.tile(array, (repeat, 1)) if array.ndim == 2 else np.tile(array, repeat)
+                                           for array in arrays)
+    start = time.perf_counter()
+    for i in range(0, len(boards), CHUNK):
+        part = slice(i, i + CHUNK)
+        batch.analyse(boards[part], white_to_move[part], castling[part], ep[part])
+    vectorised = len(boards) / (time.perf_counter() - start)
+
+    print(f'scalar: {scalar:10.0f} positions/s')
+    print(f'batch:  {vectorised:10.0f} positions/s  (x{vectorised / scalar:.1f}, {len(boards)} positions)')
+
+
+if __name__ == '__main__':
+    main()
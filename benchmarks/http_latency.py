@@ -0,0 +1,85 @@
+"""Request latency of the move API in server.py under concurrent clients.
+
+Serves server.app on a free local port, then clients on several threads mix position reads,
+legal-move reads and move submissions against the one shared game.
+Run from the repository root:  python -m benchmarks.http_latency
+"""
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from werkzeug.serving import make_server
+
+import server
+
+CLIENTS = (1, 4, 16)
+REQUESTS = 200
+
+
+def call(url, data=None):
+    body = json.dumps(data).encode() if data is not None else None
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as response:
+            payload = json.load(response)
+    except urllib.error.HTTPError as error:
+        # A move another client already made illegal
+        payload = json.load(error)
+    return (time.perf_counter() - start) * 1000, payload
+
+
+def client(base, rng, latencies):
+    for _ in range(REQUESTS):
+        kind = rng.random()
+        if kind < 0.4:
+            ms, _ = call(base + '/position')
+        elif kind < 0.7:
+            ms, _ = call(base + '/legal_moves')
+        else:
+            ms, moves = call(base + '/legal_moves')
+            latencies.append(ms)
+            if not moves['moves']:
+                ms, _ = call(base + '/new_game', {})
+            else:
+                ms, reply = call(base + '/move', {'move': rng.choice(moves['moves'])})
+                if reply['status'] not in ('ongoing', 'check'):
+                    call(base + '/new_game', {})
+        latencies.append(ms)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    # One access-log line per request would dominate the timings
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    http_server = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{http_server.server_port}'
+    try:
+        for clients in CLIENTS:
+            call(base + '/new_game', {})
+            latencies = []
+            threads = [threading.Thread(target=client, args=(base, random.Random(i), latencies))
+                       for i in range(clients)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            seconds = time.perf_counter() - start
+            print(f'{clients:3d} clients: {len(latencies) / seconds:8.0f} req/s  '
+                  f'p50 {percentile(latencies, 0.5):6.2f} ms  p99 {percentile(latencies, 0.99):6.2f} ms')
+    finally:
+        http_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
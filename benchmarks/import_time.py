@@ -0,0 +1,43 @@
+"""Cold-import cost of the rules core.
+
+Each sample starts a fresh interpreter, so nothing is cached in-process.
+Run from the repository root:  python -m benchmarks.import_time
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = 20
+# Budget for importing pieces on top of a bare interpreter start
+BUDGET_MS = 20.0
+
+
+def run(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def median_ms(code):
+    return statistics.median(run(code) for _ in range(SAMPLES))
+
+
+def main():
+    check = "import sys, pieces; assert 'pygame' not in sys.modules, 'pieces pulled in pygame'"
+    subprocess.run([sys.executable, '-c', check], cwd=ROOT, check=True)
+
+    bare = median_ms('pass')
+    core = median_ms('import pieces')
+    cost = core - bare
+    print(f'bare interpreter: {bare:7.1f} ms')
+    print(f'import pieces:    {core:7.1f} ms  (+{cost:.1f} ms)')
+    if cost > BUDGET_MS:
+        print(f'over budget of {BUDGET_MS:.0f} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Move-validation throughput of the rules core.
+
+Run from the repository root:  python -m benchmarks.move_validation
+"""
+import time
+
+import pieces
+
+DURATION = 2.0
+
+
+def validate_all(position, is_white):
+    # The same work main.py does when a piece is clicked, for every piece of one side
+    count = 0
+    board = position.board
+    for i in range(8):
+        for j in range(8):
+            piece = board[i][j]
+            if piece and piece.white == is_white:
+                for move in piece.get_legal_moves(position, i, j):
+                    pieces.is_check_resolved(position, (move[1], move[0]), (i, j), is_white)
+                    count += 1
+    return count
+
+
+def calls_per_second(position):
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        calls += validate_all(position, True)
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    position = pieces.Board()
+    # Open the centre so kings and sliders have something to validate
+    position = pieces.make_move(position, (4, 4), (6, 4))
+    position = pieces.make_move(position, (4, 3), (1, 4))
+
+    print(f'{calls_per_second(position):10.0f} is_check_resolved calls/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Time to reach a fixed search depth with 1, 2, 4 and 8 worker processes.
+
+Each worker count starts from a fresh pool, warmed only by a depth-1 search so process start-up
+is not timed. The single-process Searcher is timed too, as the baseline for the speedups.
+Run from the repository root:  python -m benchmarks.parallel_search [-d DEPTH]
+"""
+import argparse
+import os
+
+import engine
+import pieces
+from perft import POSITIONS
+
+WORKERS = (1, 2, 4, 8)
+NAMES = ('start', 'kiwipete', 'middlegame')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-d', '--depth', type=int, default=4)
+    args = parser.parse_args(argv)
+    print(f'{os.cpu_count()} cpus, depth {args.depth}')
+
+    for name in NAMES:
+        position = pieces.Position.from_fen(POSITIONS[name][0])
+        serial = engine.Searcher().search(position, max_depth=args.depth)
+        print(f'{name:10s} serial    {serial.seconds:7.2f} s  {serial.nodes:9d} nodes  '
+              f'{pieces.uci(serial.move)} {serial.score}')
+        for workers in WORKERS:
+            with engine.ParallelSearcher(workers) as searcher:
+                # Get the worker processes running before the clock starts
+                searcher.search(position, max_depth=1)
+                result = searcher.search(position, max_depth=args.depth)
+            print(f'{name:10s} {workers} workers {result.seconds:7.2f} s  {result.nodes:9d} nodes  '
+                  f'{pieces.uci(result.move)} {result.score}  x{serial.seconds / result.seconds:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Memory held by one position and allocated by one make_move.
+
+Run from the repository root:  python -m benchmarks.position_memory
+"""
+import gc
+import tracemalloc
+
+import pieces
+
+MOVES = 1000
+
+
+def traced(func):
+    # Net bytes and live blocks allocated by func, which must keep its results alive
+    gc.collect()
+    before = tracemalloc.take_snapshot()
+    result = func()
+    after = tracemalloc.take_snapshot()
+    stats = after.compare_to(before, 'filename')
+    return result, sum(s.size_diff for s in stats), sum(s.count_diff for s in stats)
+
+
+def main():
+    tracemalloc.start()
+    pieces.Board()  # Create the flyweights up front so they are not counted
+
+    _, position_bytes, position_blocks = traced(pieces.Board)
+
+    position = pieces.Board()
+    flyweights = len(pieces._flyweights)
+    _, move_bytes, move_blocks = traced(lambda: [pieces.make_move(position, (4, 4), (6, 4)) for _ in range(MOVES)])
+    assert len(pieces._flyweights) == flyweights
+
+    print(f'position:  {position_bytes:7d} bytes in {position_blocks} blocks')
+    print(f'make_move: {move_bytes / MOVES:7.0f} bytes in {move_blocks / MOVES:.1f} blocks')
+    print(f'piece objects in the process: {flyweights}')
+
+
+if __name__ == '__main__':
+    main()
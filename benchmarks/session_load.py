@@ -0,0 +1,89 @@
+"""Throughput and latency of the hosted games under /games as the number of live games grows.
+
+Serves server.app on a free local port, opens the games, then client threads play random legal
+moves in randomly chosen games. Memory per game is measured separately with tracemalloc.
+Run from the repository root:  python -m benchmarks.session_load
+"""
+import logging
+import random
+import threading
+import time
+import tracemalloc
+
+from werkzeug.serving import make_server
+
+import server
+from benchmarks.http_latency import call, percentile
+from sessions import GAME_BYTES, SessionManager
+
+GAMES = (100, 1000, 10000)
+CLIENTS = 8
+REQUESTS = 250
+# Moves played into each game before its memory is measured
+MEMORY_MOVES = 40
+
+
+def client(base, ids, rng, latencies):
+    for _ in range(REQUESTS // 2):
+        game_id = rng.choice(ids)
+        ms, reply = call(f'{base}/games/{game_id}/legal_moves')
+        latencies.append(ms)
+        if reply['moves']:
+            ms, _ = call(f'{base}/games/{game_id}/move', {'move': rng.choice(reply['moves'])})
+        else:
+            ms, _ = call(f'{base}/games/{game_id}')
+        latencies.append(ms)
+
+
+def bytes_per_game(count=1000):
+    rng = random.Random(1)
+    manager = SessionManager(max_games=count)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(count):
+        session = manager.create()
+        for _ in range(MEMORY_MOVES):
+            moves = session.legal_moves()
+            if not moves:
+                break
+            session.apply(rng.choice(moves))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / count
+
+
+def main():
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    print(f'memory: {bytes_per_game():.0f} bytes per game after {MEMORY_MOVES} moves '
+          f'(budgeted at sessions.GAME_BYTES = {GAME_BYTES})')
+
+    http_server = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{http_server.server_port}'
+    ids = []
+    try:
+        for games in GAMES:
+            opened = games - len(ids)
+            start = time.perf_counter()
+            while len(ids) < games:
+                ids.append(call(base + '/games', {})[1]['id'])
+            created = time.perf_counter() - start
+
+            latencies = []
+            threads = [threading.Thread(target=client, args=(base, ids, random.Random(i), latencies))
+                       for i in range(CLIENTS)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            seconds = time.perf_counter() - start
+            print(f'{games:6d} games: {len(latencies) / seconds:7.0f} req/s  '
+                  f'p50 {percentile(latencies, 0.5):6.2f} ms  p99 {percentile(latencies, 0.99):6.2f} ms  '
+                  f'(opened at {opened / created:.0f} games/s)')
+    finally:
+        http_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
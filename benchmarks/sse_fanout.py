@@ -0,0 +1,138 @@
+"""Fan-out of moves to spectators through async_server's /events stream.
+
+Serves async_server.StreamServer on a free local port in a child process, opens 1000 watchers on
+/events from one asyncio loop here, then plays random legal moves over HTTP, each once every
+watcher has the previous one. Reports how long a move takes to reach the first and the last watcher
+and the delivery rate. Watcher and server run in separate processes so neither holds the other's
+GIL; the watchers' own parsing is part of the times.
+Run from the repository root:  python -m benchmarks.sse_fanout
+"""
+import asyncio
+import json
+import multiprocessing
+import random
+import threading
+import time
+
+import async_server
+from benchmarks.http_latency import percentile
+
+WATCHERS = 1000
+MOVES = 200
+# Watchers connecting at once
+CONNECT_BATCH = 100
+
+
+def serve(connection):
+    stream_server = async_server.StreamServer('127.0.0.1', 0)
+
+    def report_port():
+        stream_server.ready.wait()
+        connection.send(stream_server.port)
+    threading.Thread(target=report_port, daemon=True).start()
+    stream_server.serve_forever()
+
+
+class Round:
+    # The move being waited for: its ply and when each watcher saw it
+    def __init__(self, ply):
+        self.ply = ply
+        self.arrivals = []
+        self.done = asyncio.Event()
+
+
+async def request(reader, writer, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+    head = await reader.readuntil(b'\r\n\r\n')
+    length = 0
+    for line in head.split(b'\r\n'):
+        name, _, value = line.partition(b':')
+        if name.lower() == b'content-length':
+            length = int(value)
+    return json.loads(await reader.readexactly(length))
+
+
+async def watch(port, state, opened):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /events HTTP/1.1\r\nHost: bench\r\n\r\n')
+    await reader.readuntil(b'\r\n\r\n')
+    await reader.readuntil(b'\n\n')
+    opened.append(writer)
+    while True:
+        block = await reader.readuntil(b'\n\n')
+        now = time.perf_counter()
+        for line in block.split(b'\n'):
+            if line.startswith(b'data:'):
+                current = state[0]
+                if current is not None and json.loads(line[5:])['ply'] == current.ply:
+                    current.arrivals.append(now)
+                    if len(current.arrivals) == WATCHERS:
+                        current.done.set()
+
+
+async def run(port):
+    # state[0] is the Round in progress, None between moves
+    state = [None]
+    opened = []
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    await request(reader, writer, 'POST', '/new_game', {})
+    start = time.perf_counter()
+    watchers = []
+    for _ in range(0, WATCHERS, CONNECT_BATCH):
+        batch = [asyncio.create_task(watch(port, state, opened)) for _ in range(CONNECT_BATCH)]
+        watchers += batch
+        while len(opened) < len(watchers):
+            await asyncio.sleep(0.01)
+    connected = time.perf_counter() - start
+
+    rng = random.Random(5)
+    first, last, deliveries = [], [], []
+    ply = 0
+    start = time.perf_counter()
+    for _ in range(MOVES):
+        moves = (await request(reader, writer, 'GET', '/legal_moves'))['moves']
+        if not moves:
+            await request(reader, writer, 'POST', '/new_game', {})
+            ply = 0
+            continue
+        ply += 1
+        current = state[0] = Round(ply)
+        sent = time.perf_counter()
+        reply = await request(reader, writer, 'POST', '/move', {'move': rng.choice(moves)})
+        await current.done.wait()
+        state[0] = None
+        first.append((min(current.arrivals) - sent) * 1000)
+        last.append((max(current.arrivals) - sent) * 1000)
+        deliveries += [(arrival - sent) * 1000 for arrival in current.arrivals]
+        if reply['status'] not in ('ongoing', 'check'):
+            await request(reader, writer, 'POST', '/new_game', {})
+            ply = 0
+    seconds = time.perf_counter() - start
+
+    for task in watchers:
+        task.cancel()
+    for watcher in opened:
+        watcher.close()
+    writer.close()
+    print(f'{WATCHERS} watchers connected in {connected:.2f} s')
+    print(f'{len(last)} moves: first watcher p50 {percentile(first, 0.5):6.2f} ms  '
+          f'last watcher p50 {percentile(last, 0.5):6.2f} ms  p99 {percentile(last, 0.99):6.2f} ms')
+    print(f'per delivery: p50 {percentile(deliveries, 0.5):6.2f} ms  p99 {percentile(deliveries, 0.99):6.2f} ms  '
+          f'({len(deliveries) / seconds:.0f} deliveries/s)')
+
+
+def main():
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child,), daemon=True)
+    process.start()
+    try:
+        asyncio.run(run(parent.recv()))
+    finally:
+        process.terminate()
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Opening book: (position key, move, weight) records in a sorted binary file.
+
+Build one from PGN files:
+    python book.py games.pgn [more.pgn ...] -o book.bin [--plies 20]
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+from collections import Counter
+
+import pgn
+import pieces
+
+# Little-endian Zobrist key, encoded move, weight; sorted by key, then by weight, highest first
+RECORD = struct.Struct('<QII')
+# Weight a move earns from a game's result, from the side that played it
+RESULT_WEIGHTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+
+
+def build(paths, output, plies=20):
+    # Compile the first plies moves of every game into a book file; returns the record count.
+    # A move's weight is 2 per win and 1 per draw of the side that played it, so moves only ever
+    # played in lost games are left out.
+    weights = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for game in pgn.read_games(f):
+                if game.result not in RESULT_WEIGHTS or 'FEN' in game.headers:
+                    continue
+                white_weight, black_weight = RESULT_WEIGHTS[game.result]
+                position = pieces.Board()
+                try:
+                    for text in game.moves[:plies]:
+                        move = pgn.parse_san(position, text)
+                        weight = white_weight if position.white_to_move else black_weight
+                        if weight:
+                            weights[position.key, pieces.encode_move(move)] += weight
+                        position.push(move)
+                        position.history.clear()
+                except ValueError:
+                    continue
+    records = sorted(weights.items(), key=lambda item: (item[0][0], -item[1]))
+    with open(output, 'wb') as f:
+        for (key, move), weight in records:
+            f.write(RECORD.pack(key, move, min(weight, 0xFFFFFFFF)))
+    return len(records)
+
+
+class OpeningBook:
+    # Read-only view of a book file through mmap, so nothing is loaded up front and every process
+    # that opens the same file shares one copy in the page cache
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            # An empty file cannot be mapped, and holds no records anyway
+            empty = os.fstat(f.fileno()).st_size == 0
+            self.data = b'' if empty else mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data) // RECORD.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def _first(self, key):
+        # Index of the first record whose key is not below key
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if RECORD.unpack_from(self.data, middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, position):
+        # [(move, weight)] stored for position, most played first, legal moves only
+        key = position.key
+        found = []
+        for index in range(self._first(key), self.size):
+            record_key, move, weight = RECORD.unpack_from(self.data, index * RECORD.size)
+            if record_key != key:
+                break
+            found.append((pieces.decode_move(move), weight))
+        if found:
+            # A key collision could store moves that are not playable here
+            legal = set(position.legal_moves())
+            found = [(move, weight) for move, weight in found if move in legal]
+        return found
+
+    def choose(self, position, rng=random):
+        # A book move picked at random in proportion to its weight, or None when out of book
+        return pick(self.entries(position), rng)
+
+
+def pick(found, rng=random):
+    # One move of a [(move, weight)] list, chosen in proportion to weight, or None for an empty list
+    if not found:
+        return None
+    return rng.choices([move for move, _ in found], weights=[weight for _, weight in found])[0]
+
+
+def open_book(path):
+    # The book at path, or None when path is empty, so callers can take it straight from the environment
+    return OpeningBook(path) if path else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('-o', '--output', default='book.bin')
+    parser.add_argument('--plies', type=int, default=20)
+    args = parser.parse_args(argv)
+    count = build(args.paths, args.output, args.plies)
+    print(f'{count} records written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
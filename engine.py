@@ -0,0 +1,599 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pieces
+from pieces import EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from tablebase import MAX_PIECES as TABLEBASE_PIECES, open_tablebase
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+# How many nodes pass between clock checks
+CHECK_EVERY = 1024
+
+PIECE_VALUES = {EMPTY: 0, PAWN: 100, KNIGHT: 320, BISHOP: 330, ROOK: 500, QUEEN: 900, KING: 0}
+
+# Piece-square bonuses from white's side, row 0 is the eighth rank (same order as pieces.SQUARES)
+PIECE_SQUARE = {
+    PAWN: (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0),
+    KNIGHT: (
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50),
+    BISHOP: (
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20),
+    ROOK: (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0),
+    QUEEN: (
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20),
+    KING: (
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20),
+}
+
+# Material plus placement for every piece code on every mailbox square, from white's side
+_PIECE_SQUARE_VALUE = [[0] * 120 for _ in range(13)]
+for _kind, _table in PIECE_SQUARE.items():
+    for _i, _sq in enumerate(pieces.SQUARES):
+        _row, _col = pieces.row_col(_sq)
+        _PIECE_SQUARE_VALUE[_kind + 6][_sq] = PIECE_VALUES[_kind] + _table[_i]
+        _PIECE_SQUARE_VALUE[-_kind + 6][_sq] = -(PIECE_VALUES[_kind] + _table[(7 - _row) * 8 + _col])
+
+SearchResult = namedtuple('SearchResult', 'move pv score depth nodes seconds nps')
+
+
+class SearchAborted(Exception):
+    pass
+
+
+def evaluate(position):
+    # Static score in centipawns for the side to move
+    squares = position.squares
+    score = 0
+    for side in position.piece_lists:
+        for sq in side:
+            score += _PIECE_SQUARE_VALUE[squares[sq] + 6][sq]
+    return score if position.white_to_move else -score
+
+
+def mvv_lva(position, move):
+    frm, to, promotion = move
+    squares = position.squares
+    victim = squares[to]
+    if victim == EMPTY and to == position.ep and abs(squares[frm]) == PAWN:
+        victim = PAWN
+    return 10 * PIECE_VALUES[abs(victim)] + PIECE_VALUES[promotion] - abs(squares[frm])
+
+
+def is_capture(position, move):
+    frm, to, promotion = move
+    return position.squares[to] != EMPTY or promotion != EMPTY or \
+        (to == position.ep and abs(position.squares[frm]) == PAWN)
+
+
+def _score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score > MATE - MAX_PLY:
+        return score + ply
+    if score < -MATE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score > MATE - MAX_PLY:
+        return score - ply
+    if score < -MATE + MAX_PLY:
+        return score + ply
+    return score
+
+
+class Searcher:
+    def __init__(self, tt=None, tt_mb=16, tablebase=None, evaluation=None):
+        self.tt = tt if tt is not None else TranspositionTable(tt_mb)
+        # Optional tablebase.Tablebase; positions it covers are scored from it instead of searched
+        self.tablebase = tablebase
+        # Static evaluation, a function of a position scored for the side to move; replaceable so
+        # variants can be played against each other
+        self.evaluate = evaluation or evaluate
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.nodes = 0
+        self.deadline = None
+        self.max_nodes = None
+        self.stopped = False
+        # (score, principal variation) of the best root move so far in the current iteration
+        self.root_best = None
+
+    def stop(self):
+        # Ask a running search, e.g. on another thread, to return as soon as possible
+        self.stopped = True
+
+    def search(self, position, max_time=None, max_nodes=None, max_depth=MAX_PLY, on_iteration=None):
+        # Iterative deepening until the time or node budget runs out; the result of the last
+        # completed depth is returned, so the budget is a hard limit
+        start = self.begin(max_time, max_nodes)
+        position = position.copy(history=True)
+        legal = position.legal_moves()
+        if len(legal) <= 1:
+            return SearchResult(legal[0] if legal else None, legal[:1], 0, 0, 0, 0.0, 0.0)
+        known = self.tablebase_move(position, legal)
+        if known is not None:
+            seconds = time.perf_counter() - start
+            return SearchResult(known[0], [known[0]], known[1], 0, 0, seconds, 0.0)
+        # Ordered as the first iteration would search them, so a budget spent before it finishes
+        # still leaves a hash move or good capture rather than whichever move was generated first
+        entry = self.tt.probe(position.key)
+        legal = self.order(position, legal, entry[3] if entry else 0, 0)
+        best = SearchResult(legal[0], legal[:1], 0, 0, 0, 0.0, 0.0)
+        for depth in range(1, max_depth + 1):
+            try:
+                score, pv = self.root(position, depth, legal)
+            except SearchAborted:
+                # Every root move is searched with a full window, so the best of those finished in
+                # the cut-short iteration is the best move known
+                if self.root_best is not None:
+                    score, pv = self.root_best
+                    best = best._replace(move=pv[0], pv=pv, score=score)
+                break
+            seconds = time.perf_counter() - start
+            best = SearchResult(pv[0], pv, score, depth, self.nodes, seconds, self.nodes / seconds if seconds else 0.0)
+            if on_iteration:
+                on_iteration(best)
+            if abs(score) > MATE - MAX_PLY:
+                break
+            # A new iteration rarely finishes in less time than all the previous ones
+            if self.deadline is not None and time.perf_counter() + seconds > self.deadline:
+                break
+        seconds = time.perf_counter() - start
+        return best._replace(nodes=self.nodes, seconds=seconds, nps=self.nodes / seconds if seconds else 0.0)
+
+    def begin(self, max_time=None, max_nodes=None):
+        # Reset the per-search state and start the clock
+        start = time.perf_counter()
+        self.tt.new_search()
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.nodes = 0
+        self.deadline = start + max_time if max_time is not None else None
+        self.max_nodes = max_nodes
+        self.stopped = False
+        return start
+
+    def tablebase_score(self, position, ply):
+        # Score of a position the tablebase covers, mates counted from the root, or None
+        if self.tablebase is None or \
+                len(position.piece_lists[0]) + len(position.piece_lists[1]) > TABLEBASE_PIECES:
+            return None
+        known = self.tablebase.probe(position)
+        if known is None:
+            return None
+        result, plies = known
+        return result * (MATE - ply - plies)
+
+    def tablebase_move(self, position, moves):
+        # (move, score) of the fastest win or slowest loss when every move leads to a covered position
+        best = None
+        for move in moves:
+            position.push(move)
+            score = self.tablebase_score(position, 1)
+            position.pop()
+            if score is None:
+                return None
+            if best is None or -score > best[1]:
+                best = move, -score
+        return best
+
+    def root(self, position, depth, moves):
+        alpha, beta = -INFINITY, INFINITY
+        best_pv = None
+        self.root_best = None
+        entry = self.tt.probe(position.key)
+        for move in self.order(position, moves, entry[3] if entry else 0, 0):
+            position.push(move)
+            try:
+                score, pv = self.negamax(position, depth - 1, -beta, -alpha, 1)
+            finally:
+                position.pop()
+            score = -score
+            if best_pv is None or score > alpha:
+                alpha = score
+                best_pv = [move] + pv
+                self.root_best = alpha, best_pv
+        self.tt.store(position.key, depth, _score_to_tt(alpha, 0), EXACT, pieces.encode_move(best_pv[0]))
+        # The best move is tried first on the next iteration
+        moves.remove(best_pv[0])
+        moves.insert(0, best_pv[0])
+        return alpha, best_pv
+
+    def tick(self):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            if self.stopped or (self.deadline is not None and time.perf_counter() >= self.deadline):
+                raise SearchAborted
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchAborted
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        self.tick()
+        # Draws by the game's rules: the fifty-move rule, and any position already seen in the game
+        # or on the search path, since whoever repeated it can keep repeating it
+        if position.halfmove >= 100 or (position.halfmove >= 4 and position.repetitions()):
+            return 0, []
+        white = position.white_to_move
+        in_check = pieces.is_square_attacked(position, position.kings[white], not white)
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(position, alpha, beta, ply), []
+        known = self.tablebase_score(position, ply)
+        if known is not None:
+            return known, []
+
+        original_alpha = alpha
+        entry = self.tt.probe(position.key)
+        tt_move = 0
+        if entry:
+            tt_depth, tt_score, tt_flag, tt_move = entry
+            if tt_depth >= depth:
+                tt_score = _score_from_tt(tt_score, ply)
+                if tt_flag == EXACT or (tt_flag == LOWER and tt_score >= beta) or \
+                        (tt_flag == UPPER and tt_score <= alpha):
+                    return tt_score, [pieces.decode_move(tt_move)] if tt_move else []
+
+        best_score, best_pv, legal = -INFINITY, [], 0
+        for move in self.order(position, position.pseudo_legal_moves(), tt_move, ply):
+            position.push(move)
+            if pieces.is_square_attacked(position, position.kings[white], not white):
+                position.pop()
+                continue
+            legal += 1
+            try:
+                score, pv = self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                position.pop()
+            score = -score
+            if score > best_score:
+                best_score, best_pv = score, [move] + pv
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not is_capture(position, move):
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                break
+
+        if legal == 0:
+            # Checkmate, preferring the quickest, or stalemate
+            return (-MATE + ply if in_check else 0), []
+
+        flag = UPPER if best_score <= original_alpha else LOWER if best_score >= beta else EXACT
+        self.tt.store(position.key, depth, _score_to_tt(best_score, ply), flag, pieces.encode_move(best_pv[0]))
+        return best_score, best_pv
+
+    def quiescence(self, position, alpha, beta, ply):
+        # Resolve captures so the static evaluation is not taken in the middle of an exchange
+        self.tick()
+        stand_pat = self.evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        white = position.white_to_move
+        captures = [move for move in position.pseudo_legal_moves() if is_capture(position, move)]
+        captures.sort(key=lambda move: mvv_lva(position, move), reverse=True)
+        for move in captures:
+            position.push(move)
+            if pieces.is_square_attacked(position, position.kings[white], not white):
+                position.pop()
+                continue
+            try:
+                score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            finally:
+                position.pop()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def order(self, position, moves, tt_move, ply):
+        # Hash move, then captures by MVV-LVA, then killer moves, then the rest
+        killers = self.killers[ply]
+
+        def rank(move):
+            if tt_move and pieces.encode_move(move) == tt_move:
+                return 1 << 20
+            if is_capture(position, move):
+                return (1 << 16) + mvv_lva(position, move)
+            if move == killers[0]:
+                return 2
+            if move == killers[1]:
+                return 1
+            return 0
+
+        return sorted(moves, key=rank, reverse=True)
+
+
+# The Searcher of a worker process; it and its table live as long as the process
+_worker_searcher = None
+
+
+def _start_worker(tt_mb, tablebase_directory=None):
+    global _worker_searcher
+    _worker_searcher = Searcher(tt_mb=tt_mb, tablebase=open_tablebase(tablebase_directory))
+
+
+def _search_position(position, max_time):
+    # A whole search run in a worker, for callers that must not block on it
+    return _worker_searcher.search(position, max_time=max_time)
+
+
+def _search_root_move(position, move, depth, alpha, beta, deadline):
+    # Score of one root move at depth within (alpha, beta), run in a worker. deadline is on the
+    # time.time() clock, which the processes share; None means the deadline passed first.
+    searcher = _worker_searcher
+    searcher.begin(deadline - time.time() if deadline is not None else None)
+    # position is this task's own unpickled copy, with the game's undo records
+    position.push(move)
+    try:
+        score, pv = searcher.negamax(position, depth - 1, -beta, -alpha, 1)
+    except SearchAborted:
+        return None, searcher.nodes
+    return (-score, [move] + pv), searcher.nodes
+
+
+class ParallelSearcher:
+    # Iterative deepening with the root moves shared out over worker processes, so a search is not
+    # held to one core by the GIL. Each worker keeps its own transposition table between tasks.
+    #
+    # Every iteration searches the first move with a full window while the rest are tested in
+    # parallel against the previous iteration's score with a null window. Once the first move's score
+    # is known, the moves whose test does not already rule them out are searched again with it as
+    # the lower bound, and the best exact score wins.
+
+    def __init__(self, workers=4, tt_mb=16):
+        self.workers = workers
+        self.tt_mb = tt_mb
+        self.pool = None
+
+    def start(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, initializer=_start_worker, initargs=(self.tt_mb,))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def search(self, position, max_time=None, max_depth=MAX_PLY, on_iteration=None):
+        # Same budget rules and result as Searcher.search, less the node limit
+        start = time.perf_counter()
+        deadline = time.time() + max_time if max_time is not None else None
+        pool = self.start()
+        # Each task gets the root with the game's undo records, so workers see repetitions too
+        root = position.copy(history=True)
+        # Captures first by MVV-LVA, so running out of time at depth 1 still plays the best of them
+        moves = sorted(position.legal_moves(), reverse=True,
+                       key=lambda move: mvv_lva(position, move) if is_capture(position, move) else -1 << 16)
+        best = SearchResult(moves[0] if moves else None, moves[:1], 0, 0, 0, 0.0, 0.0)
+        nodes = 0
+        if len(moves) <= 1:
+            return best
+        guess = None
+        for depth in range(1, max_depth + 1):
+            first = pool.submit(_search_root_move, root, moves[0], depth, -INFINITY, INFINITY, deadline)
+            # Null-window tests: does the move score above the guess?
+            tests = [pool.submit(_search_root_move, root, move, depth, guess, guess + 1, deadline)
+                     if guess is not None else None for move in moves[1:]]
+            result, count = first.result()
+            nodes += count
+            aborted = result is None
+            alpha, best_pv = result if result else (None, None)
+            again = []
+            for move, test in zip(moves[1:], tests):
+                if test is None:
+                    again.append(move)
+                    continue
+                outcome, count = test.result()
+                nodes += count
+                if outcome is None:
+                    aborted = True
+                elif not aborted and not (outcome[0] <= guess and guess <= alpha):
+                    again.append(move)
+            if aborted:
+                break
+            searches = [(move, pool.submit(_search_root_move, root, move, depth, alpha, INFINITY, deadline))
+                        for move in again]
+            for move, future in searches:
+                outcome, count = future.result()
+                nodes += count
+                if outcome is None:
+                    aborted = True
+                elif outcome[0] > alpha:
+                    alpha, best_pv = outcome
+            if aborted:
+                break
+
+            seconds = time.perf_counter() - start
+            best = SearchResult(best_pv[0], best_pv, alpha, depth, nodes, seconds, nodes / seconds if seconds else 0.0)
+            if on_iteration:
+                on_iteration(best)
+            if abs(alpha) > MATE - MAX_PLY:
+                break
+            if deadline is not None and time.time() + seconds > deadline:
+                break
+            guess = alpha
+            moves.remove(best_pv[0])
+            moves.insert(0, best_pv[0])
+        seconds = time.perf_counter() - start
+        return best._replace(nodes=nodes, seconds=seconds, nps=nodes / seconds if seconds else 0.0)
+
+
+class SearchJob:
+    # One search handed to a SearchThread. A ponder job searches the position after the reply
+    # ponder_move is expected to be, with no time limit until the reply is known.
+    __slots__ = ('position', 'max_time', 'ponder_move', 'started', 'deadline', 'cancelled', 'result')
+
+    def __init__(self, position, max_time, ponder_move=None):
+        self.position = position
+        self.max_time = max_time
+        self.ponder_move = ponder_move
+        self.started = time.perf_counter()
+        # Set when a ponder job becomes a timed search
+        self.deadline = None
+        self.cancelled = False
+        # A ponder job's result when it finished before the reply was known
+        self.result = None
+
+
+class SearchThread:
+    # Runs a Searcher on a worker thread, so a render loop never waits on it. Every finished job
+    # is put on results as (job, SearchResult), then on_done, if given, is called on the worker
+    # thread, e.g. to wake the loop. Searches run one at a time and share the Searcher's table, so
+    # a ponder search leaves its work behind for the search that follows it.
+
+    def __init__(self, searcher, on_done=None):
+        self.searcher = searcher
+        self.on_done = on_done
+        self.results = queue.Queue()
+        # The job started last, pending or running until its result is handed over
+        self.job = None
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def think(self, position, max_time):
+        # Search position for up to max_time seconds, dropping any earlier job
+        return self._start(SearchJob(position.copy(history=True), max_time))
+
+    def ponder(self, position, move, max_time):
+        # Search the position after the expected reply move until ponder_hit or cancel
+        position = position.copy(history=True)
+        position.push(move)
+        return self._start(SearchJob(position, max_time, move))
+
+    def ponder_hit(self):
+        # The expected reply was played: finish the ponder search so it has run max_time seconds in
+        # all, at once if it already has
+        with self._lock:
+            job = self.job
+            if job is None or job.ponder_move is None or job.cancelled:
+                return None
+            job.ponder_move = None
+            job.deadline = max(time.perf_counter(), job.started + job.max_time)
+            self.searcher.deadline = job.deadline
+            if job.result is not None:
+                self._deliver(job, job.result)
+        return job
+
+    @property
+    def idle(self):
+        # No job under way and no result waiting to be taken
+        return self.job is None and self.results.empty()
+
+    def pondering(self, move=None):
+        # Whether a ponder job is running, on move when one is given
+        job = self.job
+        return job is not None and job.ponder_move is not None and not job.cancelled and \
+            (move is None or job.ponder_move == move)
+
+    def cancel(self):
+        with self._lock:
+            if self.job is not None:
+                self.job.cancelled = True
+                self.searcher.stop()
+                self.job = None
+
+    def _start(self, job):
+        self.cancel()
+        with self._lock:
+            self.job = job
+        self._jobs.put(job)
+        return job
+
+    def _deliver(self, job, result):
+        # Called holding _lock; the result is queued first so idle never sees neither
+        self.results.put((job, result))
+        self.job = None
+        if self.on_done:
+            self.on_done()
+
+    def _check(self, job):
+        # Between iterations: a job cancelled or hit before its search began missed the signal
+        if job.cancelled:
+            self.searcher.stop()
+        elif job.deadline is not None:
+            self.searcher.deadline = job.deadline
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job.cancelled:
+                continue
+            result = self.searcher.search(job.position, max_time=None if job.ponder_move else job.max_time,
+                                          on_iteration=lambda best: self._check(job))
+            with self._lock:
+                if job.cancelled:
+                    continue
+                if job.ponder_move is not None:
+                    # Finished early, e.g. on a forced mate; kept until the reply is known
+                    job.result = result
+                else:
+                    self._deliver(job, result)
+
+
+def best_move(position, max_time=1.0, max_nodes=None, max_depth=MAX_PLY, searcher=None):
+    return (searcher or Searcher()).search(position, max_time=max_time, max_nodes=max_nodes, max_depth=max_depth)
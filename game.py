@@ -0,0 +1,151 @@
+import pieces
+
+# How a game ended, as GameState.outcome. The draws other than stalemate end the game at once
+# instead of waiting for a claim.
+CHECKMATE = 'checkmate'
+STALEMATE = 'stalemate'
+INSUFFICIENT_MATERIAL = 'insufficient_material'
+FIFTY_MOVES = 'fifty_moves'
+REPETITION = 'threefold_repetition'
+
+
+def outcome(position, legal_moves, in_check):
+    # How the game has ended in position, or None while it goes on, from the one legal-move list
+    if not legal_moves:
+        return CHECKMATE if in_check else STALEMATE
+    if position.insufficient_material():
+        return INSUFFICIENT_MATERIAL
+    if position.halfmove >= 100:
+        return FIFTY_MOVES
+    if position.repetitions() >= 2:
+        return REPETITION
+    return None
+
+
+class GameState:
+    # A game in progress plus everything the UI asks about the current position. Status and the
+    # legal-move map are worked out once per position, on first use, and dropped when a move is applied.
+
+    def __init__(self, position=None, tablebase=None):
+        # Optional tablebase.Tablebase, for the known result of positions with few pieces
+        self.tablebase = tablebase
+        self.reset(position)
+
+    def reset(self, position=None):
+        # Start over from position, the standard start by default
+        self.position = position if position is not None else pieces.Board()
+        self.moves = []
+        self._legal_moves = None
+        self._move_map = None
+        self._in_check = None
+        self._outcome = None
+
+    def _refresh(self):
+        position = self.position
+        self._legal_moves = position.legal_moves()
+        self._in_check = position.in_check()
+        self._outcome = outcome(position, self._legal_moves, self._in_check)
+        # (row, col) of a piece -> {(row, col) target: move}; a promotion target maps to the queen promotion
+        move_map = {}
+        for move in self._legal_moves:
+            frm, to, promotion = move
+            targets = move_map.setdefault(pieces.row_col(frm), {})
+            if promotion in (pieces.EMPTY, pieces.QUEEN):
+                targets[pieces.row_col(to)] = move
+        self._move_map = move_map
+
+    @property
+    def white_to_move(self):
+        return self.position.white_to_move
+
+    @property
+    def legal_moves(self):
+        if self._legal_moves is None:
+            self._refresh()
+        return self._legal_moves
+
+    @property
+    def move_map(self):
+        if self._move_map is None:
+            self._refresh()
+        return self._move_map
+
+    @property
+    def in_check(self):
+        if self._in_check is None:
+            self._refresh()
+        return self._in_check
+
+    @property
+    def outcome(self):
+        # One of the results above, or None while the game goes on
+        if self._legal_moves is None:
+            self._refresh()
+        return self._outcome
+
+    @property
+    def checkmate(self):
+        return self.outcome == CHECKMATE
+
+    @property
+    def stalemate(self):
+        return self.outcome == STALEMATE
+
+    @property
+    def game_over(self):
+        return self.outcome is not None
+
+    @property
+    def winner(self):
+        # True for white, False for black, None unless the game ended in checkmate
+        return not self.white_to_move if self.checkmate else None
+
+    @property
+    def tablebase_result(self):
+        # (1 win, 0 draw or -1 loss for the side to move, plies to mate), or None when not covered
+        return self.tablebase.probe(self.position) if self.tablebase is not None else None
+
+    def king_square(self, white=None):
+        # (row, col) of a king, the side to move's by default
+        return pieces.row_col(self.position.king_square(self.white_to_move if white is None else white))
+
+    def targets(self, row, col):
+        # Squares the piece on (row, col) may legally move to; none once the game is over
+        if self.game_over:
+            return []
+        return list(self.move_map.get((row, col), ()))
+
+    def find_move(self, curr_pos, future_pos):
+        # The legal move from one (row, col) to another, or None
+        return self.move_map.get(curr_pos, {}).get(future_pos)
+
+    def apply(self, move):
+        self.position.push(move)
+        self.moves.append(move)
+        self._legal_moves = None
+        self._move_map = None
+        self._in_check = None
+        self._outcome = None
+
+    def play(self, curr_pos, future_pos):
+        # Apply the move between two (row, col) squares if it is legal; returns whether it was
+        move = self.find_move(curr_pos, future_pos)
+        if move is None or self.game_over:
+            return False
+        self.apply(move)
+        return True
+
+
+def report_outcome(game_state):
+    # Print how the game ended, or, in an endgame the tablebase covers, the result with best play
+    if game_state.checkmate:
+        print("WHITE IS IN CHECKMATE" if game_state.white_to_move else "BLACK IS IN CHECKMATE")
+    elif game_state.game_over:
+        print("DRAW BY " + game_state.outcome.replace('_', ' ').upper())
+    elif game_state.tablebase_result:
+        result, plies = game_state.tablebase_result
+        if result:
+            mating_side = game_state.white_to_move == (result == 1)
+            print(("WHITE" if mating_side else "BLACK") + f" MATES IN {(plies + 1) // 2}")
+        else:
+            print("TABLEBASE DRAW")
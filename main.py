@@ -1,118 +1,91 @@
 import copy
+import os
+import time
 
 import pygame
-import pieces
-
-EMPTY = None
-SCREEN_WIDTH = 640
-SCREEN_HEIGHT = 640
-BLOCKSIZE = 640 // 8
-LIGHT = (233, 215, 182)
-DARK = (171, 136, 102)
-YELLOW = (255, 218, 112)
-RED = (255, 0, 0)
-LIGHT_YELLOW = ((255 * 2 + 233) // 3, (218 * 2 + 215) // 3, (112 * 2 + 182) // 3)
-DARK_YELLOW = ((255 * 2 + 171) // 3, (218 * 2 + 136) // 3, (112 * 2 + 102) // 3)
+import book
+import engine
+import game
+import metrics
+import tablebase
+from render import BoardRenderer, BLOCKSIZE, SCREEN_HEIGHT, SCREEN_WIDTH, draw
+
+# CHESS_ENGINE=white or CHESS_ENGINE=black lets the computer play that side
+ENGINE_COLOR = {'white': True, 'black': False}.get(os.environ.get('CHESS_ENGINE', '').lower())
+# Upper bound on the computer's thinking time per move, in seconds
+ENGINE_MOVE_TIME = float(os.environ.get('CHESS_ENGINE_TIME', '1.0'))
+# CHESS_BOOK=path/to/book.bin lets the computer play its opening moves from a book built by book.py
+OPENING_BOOK = book.open_book(os.environ.get('CHESS_BOOK'))
+# CHESS_TABLEBASES=path/to/tables lets the computer play endgames from tables built by tablebase.py
+TABLEBASE = tablebase.open_tablebase(os.environ.get('CHESS_TABLEBASES'))
+# CHESS_PONDER=1 lets the computer search the reply it expects while the human is thinking
+PONDER = os.environ.get('CHESS_PONDER', '') not in ('', '0')
 
 pygame.init()
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-
-
-def draw_piece(piece):
-    rect = piece.img.get_rect()
-    rect.center = (piece.y * BLOCKSIZE + BLOCKSIZE // 2, piece.x * BLOCKSIZE + BLOCKSIZE // 2)
-    screen.blit(piece.img, rect)
-
-
-def draw_grid():
-    for i in range(0, SCREEN_WIDTH, BLOCKSIZE):
-        for j in range(0, SCREEN_HEIGHT, BLOCKSIZE):
-            rect = pygame.rect.Rect(i, j, BLOCKSIZE, BLOCKSIZE)
-            if ((i + j) // BLOCKSIZE) % 2 == 0:
-                pygame.draw.rect(screen, LIGHT, rect)
-            else:
-                pygame.draw.rect(screen, DARK, rect)
-
-
-def draw_board(board):
-    for i in range(8):
-        for j in range(8):
-            if board[i][j] is not EMPTY:
-                draw_piece(board[i][j])
-
-
-def show_legal_moves(legal_moves):
-    for legal_move in legal_moves:
-        rect = pygame.rect.Rect(legal_move[1] * BLOCKSIZE, legal_move[0] * BLOCKSIZE, BLOCKSIZE, BLOCKSIZE)
-        pygame.draw.rect(screen, (LIGHT_YELLOW if (legal_move[0] + legal_move[1]) % 2 == 0 else DARK_YELLOW), rect)
+# Posted by the search thread when a search has finished
+ENGINE_DONE = pygame.USEREVENT + 1
 
 
 def main():
-    white_player = True
-    board_class = pieces.Board()
+    metrics.setup()
+    game_state = game.GameState(tablebase=TABLEBASE)
     piece_clicked = None
     legal_moves = None
+    # Searches run on their own thread and come back through its results queue, so the window is
+    # drawn and answers clicks while the engine thinks
+    search = engine.SearchThread(engine.Searcher(tablebase=TABLEBASE),
+                                 on_done=lambda: pygame.event.post(pygame.event.Event(ENGINE_DONE)))
+    renderer = BoardRenderer(screen)
+    draw(renderer, game_state, piece_clicked, legal_moves)
     while True:
-        for event in pygame.event.get():
+        if game_state.white_to_move == ENGINE_COLOR and not game_state.game_over and search.idle:
+            move = OPENING_BOOK and OPENING_BOOK.choose(game_state.position)
+            if move is not None:
+                game_state.apply(move)
+                game.report_outcome(game_state)
+                draw(renderer, game_state, piece_clicked, legal_moves)
+                continue
+            search.think(game_state.position, ENGINE_MOVE_TIME)
+
+        # Sleep until something happens: a click, or the search thread handing back a move
+        events = [pygame.event.wait()] + pygame.event.get()
+        received = time.perf_counter()
+        for event in events:
             if event.type == pygame.QUIT:
                 pygame.quit()
                 exit()
-            elif event.type == pygame.MOUSEBUTTONDOWN:
+            elif event.type == pygame.MOUSEBUTTONDOWN and game_state.white_to_move != ENGINE_COLOR:
                 pos = pygame.mouse.get_pos()
                 x, y = pos[0] // BLOCKSIZE, pos[1] // BLOCKSIZE
                 if legal_moves and (y, x) in legal_moves:
-                    if isinstance(board_class.board[piece_clicked[1]][piece_clicked[0]], pieces.King) and \
-                            board_class.board[piece_clicked[1]][piece_clicked[0]].is_castle(y, x):
-                        board_class.board = pieces.castle(board_class.board, x, y, True)
-                    else:
-                        board_class.board = pieces.make_move(board_class.board, (x, y),
-                                                             (piece_clicked[1], piece_clicked[0]))
+                    if game_state.play((piece_clicked[1], piece_clicked[0]), (y, x)):
+                        # The search on the expected reply carries on if it was right and the game
+                        # goes on
+                        if game_state.game_over or not (search.pondering(game_state.moves[-1])
+                                                        and search.ponder_hit()):
+                            search.cancel()
+                    game.report_outcome(game_state)
                     piece_clicked = None
                     legal_moves = None
-                    if white_player:
-                        white_player = False
-                    else:
-                        white_player = True
-                elif board_class.board[y][x] is not EMPTY and board_class.board[y][x].white == white_player:
+                elif game_state.move_map.get((y, x)):
                     piece_clicked = x, y
-                    legal_moves = board_class.board[piece_clicked[1]][piece_clicked[0]].get_legal_moves(
-                        board_class.board)
-                    moves_to_remove = []
-                    for move in legal_moves:
-                        if not pieces.is_check_resolved(board_class.board, (move[1], move[0]),
-                                                        (piece_clicked[1], piece_clicked[0]),
-                                                        is_white=white_player):
-                            moves_to_remove.append(move)
-
-                    for move in moves_to_remove:
-                        legal_moves.remove(move)
-
-        screen.fill('black')
-        draw_grid()
-        if piece_clicked:
-            clicked_rect = pygame.rect.Rect(piece_clicked[0] * BLOCKSIZE, piece_clicked[1] * BLOCKSIZE, BLOCKSIZE,
-                                            BLOCKSIZE)
-            if (piece_clicked[0] + piece_clicked[1]) % 2 == 0:
-                color = LIGHT_YELLOW
-            else:
-                color = DARK_YELLOW
-            pygame.draw.rect(screen, color, clicked_rect)
-            show_legal_moves(legal_moves)
-        white_king_pos = pieces.get_king_position(board_class.board)
-        black_king_pos = pieces.get_king_position(board_class.board, False)
-        white_king_in_check = pieces.in_check(board_class.board, white_king_pos[0], white_king_pos[1], True)
-        if white_king_in_check:
-            rect = pygame.rect.Rect(white_king_pos[1] * BLOCKSIZE, white_king_pos[0] * BLOCKSIZE, BLOCKSIZE, BLOCKSIZE)
-            pygame.draw.rect(screen, RED, rect)
-        black_king_in_check = pieces.in_check(board_class.board, black_king_pos[0], black_king_pos[1], False)
-        if black_king_in_check:
-            rect = pygame.rect.Rect(black_king_pos[1] * BLOCKSIZE, black_king_pos[0] * BLOCKSIZE, BLOCKSIZE, BLOCKSIZE)
-            pygame.draw.rect(screen, RED, rect)
-        if pieces.checkmate(board_class.board, white_king_pos[0], white_king_pos[1], True):
-            print("WHITE IS IN CHECKMATE")
-        draw_board(board_class.board)
-        pygame.display.update()
-        pygame.time.Clock().tick(60)
+                    legal_moves = game_state.targets(y, x)
+            elif event.type == ENGINE_DONE:
+                while not search.results.empty():
+                    job, result = search.results.get()
+                    if job.position.key != game_state.position.key or result.move is None \
+                            or game_state.game_over:
+                        continue
+                    game_state.apply(result.move)
+                    game.report_outcome(game_state)
+                    if PONDER and not game_state.game_over and len(result.pv) > 1:
+                        search.ponder(game_state.position, result.pv[1], ENGINE_MOVE_TIME)
+            elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                renderer.invalidate()
+
+        draw(renderer, game_state, piece_clicked, legal_moves)
+        metrics.observe(metrics.event_seconds, received)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,191 @@
+"""Opt-in counters, timers and histograms for the move-generator hot paths and the pygame loop.
+
+CHESS_METRICS=1 wraps the hot functions of pieces.py and game.py with timers when the program
+starts; without it nothing is wrapped, so they run exactly as before. server.py exports the
+numbers at /metrics in the Prometheus text format.
+CHESS_PROFILE=path runs the main thread under cProfile and writes the stats to path at exit;
+read them with  python -m pstats path
+"""
+import atexit
+import cProfile
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+
+import game
+import pieces
+
+# Histogram bucket upper bounds in seconds, for frames and event handling
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+_PIECE_NAMES = {pieces.PAWN: 'pawn', pieces.KNIGHT: 'knight', pieces.BISHOP: 'bishop',
+                pieces.ROOK: 'rook', pieces.QUEEN: 'queen', pieces.KING: 'king'}
+
+enabled = False
+_lock = threading.Lock()
+# (function, piece) -> [calls, seconds]; piece is '' for functions that are not per piece
+_calls = defaultdict(lambda: [0, 0.0])
+_histograms = {}
+
+
+class Histogram:
+    __slots__ = ('help', 'counts', 'sum', 'count')
+
+    def __init__(self, help):
+        self.help = help
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        with _lock:
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += seconds
+            self.count += 1
+
+
+def histogram(name, help):
+    # The histogram registered under name, created on first use
+    if name not in _histograms:
+        _histograms[name] = Histogram(help)
+    return _histograms[name]
+
+
+frame_seconds = histogram('chess_frame_seconds', 'Time to draw one frame of the board.')
+event_seconds = histogram('chess_event_seconds',
+                          'Time from taking an event off the queue, or posting a remote move, to the redrawn frame.')
+
+
+def observe(hist, start):
+    # Record the time since start, a time.perf_counter() reading; a no-op while disabled
+    if enabled:
+        hist.observe(time.perf_counter() - start)
+
+
+def _record(key, seconds):
+    with _lock:
+        entry = _calls[key]
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def _timed(function, name):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _record((name, ''), time.perf_counter() - start)
+    wrapper.unwrapped = function
+    return wrapper
+
+
+def _timed_piece_moves(function):
+    # Position.piece_moves, counted by the kind of piece it moves
+    @functools.wraps(function)
+    def wrapper(position, frm, moves):
+        start = time.perf_counter()
+        try:
+            return function(position, frm, moves)
+        finally:
+            _record(('Position.piece_moves', _PIECE_NAMES.get(abs(position.squares[frm]), '')), time.perf_counter() - start)
+    wrapper.unwrapped = function
+    return wrapper
+
+
+# (owner, attribute, metric label); each function has a label of its own
+_TARGETS = (
+    (pieces.Position, 'legal_moves', 'Position.legal_moves'),
+    (pieces.Position, 'in_check', 'Position.in_check'),
+    (pieces.Position, 'push', 'Position.push'),
+    (pieces.Position, 'pop', 'Position.pop'),
+    (pieces, 'is_square_attacked', 'is_square_attacked'),
+    (game, 'outcome', 'game.outcome'),
+)
+
+
+def enable():
+    # Wrap the hot functions with timers; a second call does nothing
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    pieces.Position.piece_moves = _timed_piece_moves(pieces.Position.piece_moves)
+    for owner, attribute, name in _TARGETS:
+        setattr(owner, attribute, _timed(getattr(owner, attribute), name))
+
+
+def disable():
+    # Put the original functions back; the numbers gathered so far are kept
+    global enabled
+    if not enabled:
+        return
+    enabled = False
+    pieces.Position.piece_moves = pieces.Position.piece_moves.unwrapped
+    for owner, attribute, _ in _TARGETS:
+        setattr(owner, attribute, getattr(owner, attribute).unwrapped)
+
+
+def reset():
+    with _lock:
+        _calls.clear()
+        for hist in _histograms.values():
+            hist.__init__(hist.help)
+
+
+def profile(path):
+    # Profile the calling thread until exit, then write the pstats file
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(path)
+    atexit.register(dump)
+    return profiler
+
+
+def setup():
+    # Act on CHESS_METRICS and CHESS_PROFILE; the programs call this once at startup
+    if os.environ.get('CHESS_METRICS', '') not in ('', '0'):
+        enable()
+    if os.environ.get('CHESS_PROFILE'):
+        profile(os.environ['CHESS_PROFILE'])
+
+
+def _labels(name, piece):
+    return f'function="{name}",piece="{piece}"' if piece else f'function="{name}"'
+
+
+def render():
+    # Every metric in the Prometheus text exposition format
+    with _lock:
+        calls = sorted(_calls.items())
+        histograms = [(name, hist.help, list(hist.counts), hist.sum, hist.count)
+                      for name, hist in sorted(_histograms.items())]
+    lines = [
+        '# HELP chess_metrics_enabled Whether the hot-path timers are installed.',
+        '# TYPE chess_metrics_enabled gauge',
+        f'chess_metrics_enabled {int(enabled)}',
+        '# HELP chess_calls_total Calls to an instrumented function.',
+        '# TYPE chess_calls_total counter',
+    ]
+    lines += [f'chess_calls_total{{{_labels(*key)}}} {count}' for key, (count, _) in calls]
+    lines += [
+        '# HELP chess_call_seconds_total Time spent in an instrumented function, callees included.',
+        '# TYPE chess_call_seconds_total counter',
+    ]
+    lines += [f'chess_call_seconds_total{{{_labels(*key)}}} {seconds:.9f}' for key, (_, seconds) in calls]
+    for name, help, counts, total, count in histograms:
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} histogram']
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS, counts):
+            cumulative += bucket
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f'{name}_bucket{{le="+Inf"}} {count}', f'{name}_sum {total:.9f}', f'{name}_count {count}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,137 @@
+"""Move-generation correctness and speed check.
+
+    python perft.py                        # every standard position to depth 3
+    python perft.py -d 4 -p start --divide # per-move node counts
+    python perft.py --json new.json --compare old.json
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import pieces
+
+# Standard test positions with their known node counts, depth 1 first
+POSITIONS = {
+    'start': (pieces.START_FEN, [20, 400, 8902, 197281, 4865609]),
+    'kiwipete': ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                 [48, 2039, 97862, 4085603]),
+    'endgame': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624]),
+    'promotions': ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467, 422333]),
+    'discovered': ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379, 2103487]),
+    'middlegame': ('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+                   [46, 2079, 89890, 3894594]),
+}
+
+
+def perft(position, depth):
+    moves = position.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.push(move)
+        nodes += perft(position, depth - 1)
+        position.pop()
+    return nodes
+
+
+def divide(position, depth):
+    counts = {}
+    for move in position.legal_moves():
+        position.push(move)
+        counts[pieces.uci(move)] = perft(position, depth - 1)
+        position.pop()
+    return counts
+
+
+def run(name, fen, depth, show_divide=False):
+    position = pieces.Position.from_fen(fen)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(position, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft(position, depth)
+    seconds = time.perf_counter() - start
+    expected = POSITIONS[name][1] if name in POSITIONS else []
+    result = {
+        'name': name,
+        'fen': fen,
+        'depth': depth,
+        'nodes': nodes,
+        'expected': expected[depth - 1] if depth <= len(expected) else None,
+        'seconds': seconds,
+        'nps': nodes / seconds if seconds else 0.0,
+    }
+    if counts is not None:
+        result['divide'] = counts
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(result, previous=None):
+    if result['expected'] is None:
+        status = '  ?  '
+    else:
+        status = ' ok  ' if result['nodes'] == result['expected'] else 'FAIL '
+    line = f"{status}{result['name']:<11} d={result['depth']} {result['nodes']:>10} nodes " \
+           f"{result['seconds']:8.2f} s {result['nps']:10.0f} nps"
+    if previous:
+        line += f"  ({result['nps'] / previous['nps'] - 1:+.1%} vs {previous.get('revision') or 'previous'})"
+    print(line)
+    for move, count in sorted(result.get('divide', {}).items()):
+        print(f'    {move}: {count}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-d', '--depth', type=int, default=3)
+    parser.add_argument('-p', '--position', action='append', choices=sorted(POSITIONS),
+                        help='standard position to run (repeatable, default all)')
+    parser.add_argument('--fen', help='run a custom position instead')
+    parser.add_argument('--divide', action='store_true', help='print node counts per root move')
+    parser.add_argument('--json', metavar='PATH', help='save results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='JSON from an earlier run to compare speed against')
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        targets = [('custom', args.fen)]
+    else:
+        targets = [(name, POSITIONS[name][0]) for name in args.position or POSITIONS]
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            earlier = json.load(f)
+        previous = {(r['name'], r['depth']): dict(r, revision=earlier.get('revision')) for r in earlier['results']}
+
+    results = []
+    for name, fen in targets:
+        result = run(name, fen, args.depth, args.divide)
+        report(result, previous.get((name, args.depth)))
+        results.append(result)
+
+    total_nodes = sum(r['nodes'] for r in results)
+    total_seconds = sum(r['seconds'] for r in results)
+    print(f'total {total_nodes} nodes in {total_seconds:.2f} s, {total_nodes / total_seconds:.0f} nps')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'revision': git_revision(), 'results': results}, f, indent=2)
+
+    failed = [r for r in results if r['expected'] is not None and r['nodes'] != r['expected']]
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
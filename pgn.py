@@ -0,0 +1,247 @@
+"""SAN moves and PGN games: read, write and bulk replay.
+
+Replay every game in a file through the move generator and report the rate:
+    python pgn.py games.pgn [-j WORKERS]
+"""
+import argparse
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pieces
+from pieces import EMPTY, PAWN, KING
+
+Game = namedtuple('Game', 'headers moves result')
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+# The seven tags every exported game carries, in order
+ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+_LETTERS = {kind: letter.upper() for kind, letter in pieces._PIECE_LETTERS.items()}
+_KINDS = {letter: kind for kind, letter in _LETTERS.items()}
+_SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+_TAG = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+_TOKEN = re.compile(r'\{[^}]*\}?|;.*|\$\d+|\(|\)|\d+\.(?:\.\.)?|[^\s{}();$]+')
+
+
+def san(position, move, legal=None):
+    # Standard algebraic notation for a legal move, check and mate marks included
+    frm, to, promotion = move
+    squares = position.squares
+    kind = abs(squares[frm])
+    if kind == KING and abs(to - frm) == 2:
+        text = 'O-O' if to > frm else 'O-O-O'
+    else:
+        capture = squares[to] != EMPTY or (kind == PAWN and to == position.ep)
+        if kind == PAWN:
+            text = (pieces.square_name(frm)[0] + 'x' if capture else '') + pieces.square_name(to)
+            if promotion:
+                text += '=' + _LETTERS[promotion]
+        else:
+            rivals = [other for other, other_to, _ in (legal or position.legal_moves())
+                      if other_to == to and other != frm and squares[other] == squares[frm]]
+            name = pieces.square_name(frm)
+            if not rivals:
+                hint = ''
+            elif all(pieces.square_name(other)[0] != name[0] for other in rivals):
+                hint = name[0]
+            elif all(pieces.square_name(other)[1] != name[1] for other in rivals):
+                hint = name[1]
+            else:
+                hint = name
+            text = _LETTERS[kind] + hint + ('x' if capture else '') + pieces.square_name(to)
+    position.push(move)
+    if position.in_check():
+        text += '#' if not position.legal_moves() else '+'
+    position.pop()
+    return text
+
+
+def parse_san(position, text, legal=None):
+    # The legal move text names; raises ValueError when it names none or several. Only the moves of
+    # the named piece kind are generated and tried for legality, unless legal is given.
+    clean = text.rstrip('+#!?').replace('0', 'O')
+    if clean in ('O-O', 'O-O-O'):
+        kind, to, file, rank, promotion = KING, None, None, None, EMPTY
+    else:
+        found = _SAN.match(clean)
+        if not found:
+            raise ValueError(f'not a SAN move: {text}')
+        letter, file, rank, target, promotion = found.groups()
+        kind = _KINDS[letter] if letter else PAWN
+        to = pieces.parse_square(target)
+        promotion = _KINDS[promotion] if promotion else EMPTY
+    white = position.white_to_move
+    squares = position.squares
+    if legal is None:
+        candidates = []
+        piece = kind if white else -kind
+        for sq in position.piece_lists[white]:
+            if squares[sq] == piece:
+                position.piece_moves(sq, candidates)
+    else:
+        candidates = [move for move in legal if abs(squares[move[0]]) == kind]
+
+    matches = []
+    for move in candidates:
+        frm, move_to, move_promotion = move
+        if to is None:
+            # Castling: the king's two-square step to the named side
+            if abs(move_to - frm) != 2 or (move_to > frm) != (clean == 'O-O'):
+                continue
+        elif move_to != to or move_promotion != promotion or (kind == KING and abs(move_to - frm) == 2):
+            continue
+        name = pieces.square_name(frm)
+        if (file and name[0] != file) or (rank and name[1] != rank):
+            continue
+        if legal is None:
+            position.push(move)
+            safe = not pieces.is_square_attacked(position, position.kings[white], not white)
+            position.pop()
+            if not safe:
+                continue
+        matches.append(move)
+    if len(matches) != 1:
+        raise ValueError(f'{"ambiguous" if matches else "illegal"} move: {text}')
+    return matches[0]
+
+
+def read_games(lines):
+    # Yield each game in an iterable of PGN lines as it is completed, so a file of any size is read
+    # in constant memory. Comments, variations and annotations are dropped.
+    headers, moves, depth, comment = {}, [], 0, False
+    for line in lines:
+        if comment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line, comment = line[end + 1:], False
+        stripped = line.strip()
+        if not stripped or stripped.startswith('%'):
+            continue
+        if stripped.startswith('[') and depth == 0:
+            if moves:
+                # A new game began before the last one gave a result
+                yield Game(headers, moves, headers.get('Result', '*'))
+                headers, moves = {}, []
+            tag = _TAG.match(stripped)
+            if tag:
+                headers[tag.group(1)] = tag.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+        for token in _TOKEN.findall(stripped):
+            first = token[0]
+            if first == '{':
+                comment = not token.endswith('}')
+            elif first == '(':
+                depth += 1
+            elif first == ')':
+                depth -= 1
+            elif depth or first in ';$' or first.isdigit() and token.endswith('.'):
+                continue
+            elif token in RESULTS:
+                yield Game(headers, moves, token)
+                headers, moves = {}, []
+            else:
+                moves.append(token)
+    if moves or headers:
+        yield Game(headers, moves, headers.get('Result', '*'))
+
+
+def replay(game):
+    # Play a game's moves from its start position; returns the final position
+    fen = game.headers.get('FEN')
+    position = pieces.Position.from_fen(fen) if fen else pieces.Board()
+    for text in game.moves:
+        position.push(parse_san(position, text))
+        position.history.clear()
+    return position
+
+
+def write_game(moves, headers=None, result='*', start=None):
+    # PGN text for moves played from start, the standard start position by default
+    position = start.copy() if start is not None else pieces.Board()
+    headers = dict(headers or {})
+    headers['Result'] = result
+    if start is not None:
+        headers.setdefault('SetUp', '1')
+        headers.setdefault('FEN', position.fen())
+    tags = list(ROSTER) + [tag for tag in headers if tag not in ROSTER]
+    text = ''.join(f'[{tag} "{headers.get(tag, "?")}"]\n' for tag in tags) + '\n'
+
+    words = []
+    for move in moves:
+        if position.white_to_move:
+            words.append(f'{position.fullmove}.')
+        elif not words:
+            words.append(f'{position.fullmove}...')
+        words.append(san(position, move))
+        position.push(move)
+    words.append(result)
+    line = ''
+    for word in words:
+        if line and len(line) + 1 + len(word) > 79:
+            text += line + '\n'
+            line = word
+        else:
+            line = f'{line} {word}' if line else word
+    return text + line + '\n'
+
+
+def _shard_lines(path, start, end):
+    # Lines of the games whose [Event tag begins in the byte range [start, end)
+    with open(path, 'rb') as f:
+        if start:
+            # Skip to the first whole line at or after start
+            f.seek(start - 1)
+            f.readline()
+        offset = f.tell()
+        began = False
+        for raw in f:
+            if raw.startswith(b'[Event '):
+                if offset >= end:
+                    return
+                began = True
+            offset += len(raw)
+            if began or not start:
+                yield raw.decode('utf-8', 'replace')
+
+
+def replay_shard(path, start, end):
+    # (games, moves, errors) for the games of one shard
+    games = moves = errors = 0
+    for game in read_games(_shard_lines(path, start, end)):
+        games += 1
+        try:
+            replay(game)
+            moves += len(game.moves)
+        except ValueError:
+            errors += 1
+    return games, moves, errors
+
+
+def replay_file(path, workers=1):
+    # Replay every game in the file, split into one byte range per worker process
+    size = os.path.getsize(path)
+    if workers <= 1:
+        return replay_shard(path, 0, size)
+    bounds = [size * i // workers for i in range(workers + 1)]
+    with ProcessPoolExecutor(workers) as pool:
+        counts = list(pool.map(replay_shard, [path] * workers, bounds[:-1], bounds[1:]))
+    return tuple(sum(column) for column in zip(*counts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('-j', '--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    games, moves, errors = replay_file(args.path, args.workers)
+    seconds = time.perf_counter() - start
+    print(f'{games} games, {moves} moves, {errors} with illegal moves in {seconds:.2f} s')
+    print(f'{games / seconds:.0f} games/s, {moves / seconds:.0f} moves/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,165 @@
-import pygame
-import copy
+import random
+from array import array
 
-pygame.init()
+# Piece codes: white pieces are positive, black pieces negative
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+# Sentinel for the two-square border of the 10x12 mailbox
+OFFBOARD = 7
+
+# Castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING = 15
+
+# Mailbox direction offsets; a row is 10 squares wide, row 0 is black's back rank
+KNIGHT_OFFSETS = (-21, -19, -12, -8, 8, 12, 19, 21)
+KING_OFFSETS = (-11, -10, -9, -1, 1, 9, 10, 11)
+BISHOP_OFFSETS = (-11, -9, 9, 11)
+ROOK_OFFSETS = (-10, -1, 1, 10)
+SLIDER_OFFSETS = {BISHOP: BISHOP_OFFSETS, ROOK: ROOK_OFFSETS, QUEEN: BISHOP_OFFSETS + ROOK_OFFSETS}
+PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+_PIECE_LETTERS = {PAWN: 'p', KNIGHT: 'n', BISHOP: 'b', ROOK: 'r', QUEEN: 'q', KING: 'k'}
+_CASTLING_LETTERS = ((WHITE_KINGSIDE, 'K'), (WHITE_QUEENSIDE, 'Q'), (BLACK_KINGSIDE, 'k'), (BLACK_QUEENSIDE, 'q'))
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+# Undo records in Position.history are (move, piece, captured, castling, ep, halfmove, key), the
+# last five as they were before the move; this is the index of the key
+_KEY = 6
+
+_flyweights = {}
+
+
+def square(row, col):
+    return 21 + row * 10 + col
+
+
+def row_col(sq):
+    return divmod(sq - 21, 10)
+
+
+def square_name(sq):
+    row, col = row_col(sq)
+    return 'abcdefgh'[col] + str(8 - row)
+
+
+def parse_square(name):
+    return square(8 - int(name[1]), 'abcdefgh'.index(name[0]))
+
+
+def uci(move):
+    frm, to, promotion = move
+    return square_name(frm) + square_name(to) + (_PIECE_LETTERS[promotion] if promotion else '')
+
+
+def encode_move(move):
+    # Pack a move into 17 bits for compact tables
+    frm, to, promotion = move
+    return frm | to << 7 | promotion << 14
+
+
+def decode_move(code):
+    return code & 127, code >> 7 & 127, code >> 14
+
+
+# The 64 playable mailbox squares in list-of-lists order (a8, b8, ..., h1)
+SQUARES = tuple(square(row, col) for row in range(8) for col in range(8))
+# Mailbox square -> index into SQUARES, -1 off the board
+INDEX64 = [-1] * 120
+for _i, _sq in enumerate(SQUARES):
+    INDEX64[_sq] = _i
+
+
+def _targets(sq, offsets):
+    return tuple(sq + offset for offset in offsets if INDEX64[sq + offset] >= 0)
+
+
+def _rays(sq, offsets):
+    # The squares along each direction from sq to the edge of the board, nearest first; directions
+    # that leave the board at once are left out
+    rays = []
+    for offset in offsets:
+        ray = []
+        to = sq + offset
+        while INDEX64[to] >= 0:
+            ray.append(to)
+            to += offset
+        if ray:
+            rays.append(tuple(ray))
+    return tuple(rays)
+
+
+# Per-square tables, indexed by mailbox square, so move generation and attack tests walk plain
+# lists of on-board squares instead of testing each step against the border
+KNIGHT_TARGETS = [()] * 120
+KING_TARGETS = [()] * 120
+# Squares a pawn on each square attacks, indexed by colour (False for black) then square
+PAWN_ATTACKS = ([()] * 120, [()] * 120)
+BISHOP_RAYS = [()] * 120
+ROOK_RAYS = [()] * 120
+QUEEN_RAYS = [()] * 120
+for _sq in SQUARES:
+    KNIGHT_TARGETS[_sq] = _targets(_sq, KNIGHT_OFFSETS)
+    KING_TARGETS[_sq] = _targets(_sq, KING_OFFSETS)
+    PAWN_ATTACKS[True][_sq] = _targets(_sq, (-11, -9))
+    PAWN_ATTACKS[False][_sq] = _targets(_sq, (9, 11))
+    BISHOP_RAYS[_sq] = _rays(_sq, BISHOP_OFFSETS)
+    ROOK_RAYS[_sq] = _rays(_sq, ROOK_OFFSETS)
+    QUEEN_RAYS[_sq] = BISHOP_RAYS[_sq] + ROOK_RAYS[_sq]
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS, QUEEN: QUEEN_RAYS}
+
+# Rights that survive a move from or to each square
+_CASTLING_MASK = [ALL_CASTLING] * 120
+_CASTLING_MASK[square(7, 4)] = ALL_CASTLING & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+_CASTLING_MASK[square(7, 7)] = ALL_CASTLING & ~WHITE_KINGSIDE
+_CASTLING_MASK[square(7, 0)] = ALL_CASTLING & ~WHITE_QUEENSIDE
+_CASTLING_MASK[square(0, 4)] = ALL_CASTLING & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+_CASTLING_MASK[square(0, 7)] = ALL_CASTLING & ~BLACK_KINGSIDE
+_CASTLING_MASK[square(0, 0)] = ALL_CASTLING & ~BLACK_QUEENSIDE
+
+# Zobrist keys; a fixed seed keeps hashes stable across processes and runs
+_zobrist_random = random.Random(0x5EED)
+# Indexed by piece code + 6, then mailbox square
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for _ in range(120)] for _ in range(13)]
+ZOBRIST_WHITE_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+# Indexed by en-passant square, 0 (no square) hashes to nothing
+ZOBRIST_EP = [0] + [_zobrist_random.getrandbits(64) for _ in range(119)]
 
 
-def promote_pawn(board, x, y, is_white):
-    board[x][y] = Queen(x, y, is_white)
-
-    return board
-
-
-def castle(board, x, y, is_white):
-    if (x, y) == (6, 7):
-        board = make_move(board, (6, 7), (7, 4))
-        board = make_move(board, (5, 7), (7, 7))
-    elif (x, y) == (2, 7):
-        board = make_move(board, (2, 7), (7, 4))
-        board = make_move(board, (3, 7), (0, 7))
-    elif (x, y) == (6, 0):
-        board = make_move(board, (6, 0), (0, 4))
-        board = make_move(board, (5, 0), (0, 7))
-    else:
-        board = make_move(board, (2, 0), (0, 4))
-        board = make_move(board, (3, 0), (0, 0))
+def zobrist_key(position):
+    # Full recomputation; push and pop keep position.key up to date incrementally
+    squares = position.squares
+    key = ZOBRIST_CASTLING[position.castling] ^ ZOBRIST_EP[position.ep]
+    if position.white_to_move:
+        key ^= ZOBRIST_WHITE_TO_MOVE
+    for sq in SQUARES:
+        if squares[sq] != EMPTY:
+            key ^= ZOBRIST_PIECES[squares[sq] + 6][sq]
+    return key
+
+
+def to_move(position, future_pos: tuple, curr_pos: tuple):
+    x, y = future_pos
+    frm = square(*curr_pos)
+    to = square(y, x)
+    # Pawns reaching the last rank are always promoted to a queen
+    promotion = QUEEN if abs(position.squares[frm]) == PAWN and (y == 0 or y == 7) else EMPTY
+    return frm, to, promotion
 
-    return board
 
+def make_move(position, future_pos: tuple, curr_pos: tuple):
+    return position.make(to_move(position, future_pos, curr_pos))
 
-def make_move(board: list[list], future_pos: tuple, curr_pos: tuple):
-    new_board = [row[:] for row in board]  # Shallow copy of the board
 
-    x, y = future_pos
-    b, a = curr_pos
-    # Create a new instance of the piece at the future position
-    new_board[y][x] = type(board[b][a])(x, y, board[b][a].white)
-
-    # Set the position of the new piece
-    new_board[y][x].x = y
-    new_board[y][x].y = x
-    # Remove the piece from its current position
-    new_board[b][a] = None
-    if isinstance(new_board[y][x], Pawn) and (y == 0 or y == 7):
-        # Perform pawn promotion
-        new_board = promote_pawn(new_board, y, x, new_board[y][x].white)
-
-    # Check if the piece is a king or a rook and update has_moved accordingly
-    if isinstance(new_board[y][x], King):
-        new_board[y][x].has_moved = True
-    elif isinstance(new_board[y][x], Rook):
-        new_board[y][x].has_moved = True
-
-    return new_board
-
-
-
-def is_check_resolved(board: list[list], future_pos: tuple, curr_pos: tuple, is_white: bool) -> bool:
-    # Make a copy of the board
-    new_board = make_move(board, future_pos, curr_pos)
-    # Get the position of the king
-    king_x, king_y = get_king_position(new_board, is_white)
+def is_check_resolved(position, future_pos: tuple, curr_pos: tuple, is_white: bool) -> bool:
+    # Try the move in place and take it back
+    position.push(to_move(position, future_pos, curr_pos))
     # Check if the king is still in check
-    return not in_check(new_board, king_x, king_y, is_white)
+    resolved = not is_square_attacked(position, position.kings[is_white], not is_white)
+    position.pop()
+    return resolved
 
 
 def print_board(board: list[list]):
@@ -70,349 +169,498 @@ def print_board(board: list[list]):
         print()
 
 
-def get_king_position(board: list[list], is_white=True):
-    for i in range(8):
-        for j in range(8):
-            if type(board[i][j]) is King and board[i][j].white == is_white:
-                return i, j
+def get_king_position(position, is_white=True):
+    return row_col(position.king_square(is_white))
 
 
-def in_check(board, king_x, king_y, is_white):
-    for i in range(8):
-        for j in range(8):
-            piece = board[i][j]
-            if piece and piece.white != is_white and type(piece) is not King:
-                legal_moves = piece.get_legal_moves(board)
-                if (king_x, king_y) in legal_moves:
-                    return True
-
-    return False
+def in_check(position, king_x, king_y, is_white):
+    return is_square_attacked(position, square(king_x, king_y), not is_white)
 
 
-def checkmate(board, king_x, king_y, is_white):
-    if not in_check(board, king_x, king_y, is_white):
-        return False
-
-    if len(board[king_x][king_y].get_legal_moves(board)) != 0:
+def checkmate(position, king_x, king_y, is_white):
+    if not in_check(position, king_x, king_y, is_white):
         return False
 
+    board = position.board
     for i in range(8):
         for j in range(8):
             piece = board[i][j]
             if piece and piece.white == is_white:
-                legal_moves = piece.get_legal_moves(board)
-                for move in legal_moves:
-                    temp_board = [row[:] for row in board]
-                    temp_board[i][j], temp_board[move[0]][move[1]] = temp_board[move[0]][move[1]], temp_board[i][j]
-                    if not in_check(temp_board, king_x, king_y, is_white):
+                for move in piece.get_legal_moves(position, i, j):
+                    if is_check_resolved(position, (move[1], move[0]), (i, j), is_white):
                         return False
     return True
 
 
-class Pawn:
-    def __init__(self, x, y, white=True):
-        self.x = x
-        self.y = y
-        self.clicked = False
-        self.white = white
-        if white:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/white-pawn.png'), (80, 80))
-        else:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/black-pawn.png'), (80, 80))
-
-    def get_legal_moves(self, board):
-        legal_moves = []
-        if self.white:
-            white_king = get_king_position(board)
-            if self.x > 0 and board[self.x - 1][self.y] is None:
-                legal_moves.append((self.x - 1, self.y))
-            if self.x == 6 and board[self.x - 2][self.y] is None and board[self.x - 1][self.y] is None:
-                legal_moves.append((self.x - 2, self.y))
-            if self.x > 0 and self.y > 0 and board[self.x - 1][self.y - 1] is not None and board[self.x - 1][
-                self.y - 1].white != self.white:
-                legal_moves.append((self.x - 1, self.y - 1))
-            if self.x > 0 and self.y < 7 and board[self.x - 1][self.y + 1] is not None and board[self.x - 1][
-                self.y + 1].white != self.white:
-                legal_moves.append((self.x - 1, self.y + 1))
-        else:
-            if self.x < 7 and board[self.x + 1][self.y] is None:
-                legal_moves.append((self.x + 1, self.y))
-            if self.x == 1 and board[self.x + 2][self.y] is None and board[self.x + 1][self.y] is None:
-                legal_moves.append((self.x + 2, self.y))
-            if self.x < 7 and self.y > 0 and board[self.x + 1][self.y - 1] is not None and board[self.x + 1][
-                self.y - 1].white != self.white:
-                legal_moves.append((self.x + 1, self.y - 1))
-            if self.x < 7 and self.y < 7 and board[self.x + 1][self.y + 1] is not None and board[self.x + 1][
-                self.y + 1].white != self.white:
-                legal_moves.append((self.x + 1, self.y + 1))
+def is_square_attacked(position, target, by_white):
+    # Work outwards from the target: it is attacked if a matching piece sits where it could strike from
+    squares = position.squares
+    sign = 1 if by_white else -1
+    # A pawn attacks the target from the squares the target's own pawn of the other colour would attack
+    pawn = sign * PAWN
+    for sq in PAWN_ATTACKS[not by_white][target]:
+        if squares[sq] == pawn:
+            return True
+    knight = sign * KNIGHT
+    for sq in KNIGHT_TARGETS[target]:
+        if squares[sq] == knight:
+            return True
+    king = sign * KING
+    for sq in KING_TARGETS[target]:
+        if squares[sq] == king:
+            return True
+    queen = sign * QUEEN
+    for sliders, rays in ((sign * ROOK, ROOK_RAYS[target]), (sign * BISHOP, BISHOP_RAYS[target])):
+        for ray in rays:
+            for sq in ray:
+                piece = squares[sq]
+                if piece != EMPTY:
+                    if piece == sliders or piece == queen:
+                        return True
+                    break
 
-        return legal_moves
+    return False
 
 
-class Rook:
-    def __init__(self, x, y, white=True):
-        self.x = x
-        self.y = y
-        self.has_moved = False
-        self.clicked = False
-        self.white = white
+class Position:
+    __slots__ = ('squares', 'white_to_move', 'castling', 'ep', 'halfmove', 'fullmove', 'kings', 'piece_lists', 'key',
+                 'history')
+
+    def __init__(self, squares, white_to_move=True, castling=ALL_CASTLING, ep=0, halfmove=0, fullmove=1):
+        # 10x12 mailbox of piece codes, OFFBOARD around the 8x8 board
+        self.squares = squares
+        self.white_to_move = white_to_move
+        # Bitmask of WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE
+        self.castling = castling
+        # Square a pawn may capture en passant onto, or 0; only set when an enemy pawn could take
+        pusher = ep + 10 if white_to_move else ep - 10
+        taker = PAWN if white_to_move else -PAWN
+        self.ep = ep if ep and taker in (squares[pusher - 1], squares[pusher + 1]) else 0
+        # Moves since the last capture or pawn move, and the move number, as in FEN
+        self.halfmove = halfmove
+        self.fullmove = fullmove
+        # [black, white] king squares and sets of occupied squares, kept up to date by push and pop
+        self.kings = [squares.index(-KING), squares.index(KING)]
+        self.piece_lists = [{sq for sq in SQUARES if squares[sq] < 0}, {sq for sq in SQUARES if 0 < squares[sq]}]
+        # 64-bit Zobrist hash of the position
+        self.key = zobrist_key(self)
+        # Undo records for pop, one per pushed move
+        self.history = []
+
+    @classmethod
+    def from_rows(cls, rows, white_to_move=True, castling=ALL_CASTLING, ep=0):
+        squares = array('b', [OFFBOARD] * 120)
+        for sq, piece in zip(SQUARES, (piece for row in rows for piece in row)):
+            squares[sq] = piece.code if piece else EMPTY
+        return cls(squares, white_to_move, castling, ep)
+
+    @classmethod
+    def from_fen(cls, fen):
+        # Raises ValueError for text that is not a FEN of a position that could arise in a game
+        fields = fen.split()
+        if len(fields) not in (4, 6):
+            raise ValueError(f'a FEN has 4 or 6 fields: {fen!r}')
+        placement, side, castling, ep = fields[:4]
+        halfmove, fullmove = (int(fields[4]), int(fields[5])) if len(fields) == 6 else (0, 1)
+        if side not in ('w', 'b'):
+            raise ValueError(f'bad side to move: {side!r}')
+        if castling != '-' and (not castling or set(castling) - set('KQkq')):
+            raise ValueError(f'bad castling rights: {castling!r}')
+        if ep != '-' and ep not in ('abcdefgh'[col] + ('6' if side == 'w' else '3') for col in range(8)):
+            raise ValueError(f'bad en passant square: {ep!r}')
+        codes = {letter: kind for kind, letter in _PIECE_LETTERS.items()}
+        ranks = placement.split('/')
+        if len(ranks) != 8:
+            raise ValueError(f'a FEN board has 8 ranks: {placement!r}')
+        squares = array('b', [OFFBOARD] * 120)
+        for row, text in enumerate(ranks):
+            col = 0
+            for char in text:
+                if char in '12345678':
+                    for _ in range(int(char)):
+                        if col < 8:
+                            squares[square(row, col)] = EMPTY
+                        col += 1
+                elif char.lower() in codes:
+                    if col < 8:
+                        kind = codes[char.lower()]
+                        squares[square(row, col)] = kind if char.isupper() else -kind
+                    col += 1
+                else:
+                    raise ValueError(f'bad piece letter: {char!r}')
+            if col != 8:
+                raise ValueError(f'a FEN rank has 8 squares: {text!r}')
+        if squares.count(KING) != 1 or squares.count(-KING) != 1:
+            raise ValueError('each side needs exactly one king')
+        if any(abs(squares[sq]) == PAWN for sq in SQUARES[:8] + SQUARES[56:]):
+            raise ValueError('pawns cannot stand on the first or last rank')
+        rights = 0
+        for bit, letter in _CASTLING_LETTERS:
+            if letter in castling:
+                rights |= bit
+        ep = 0 if ep == '-' else parse_square(ep)
+        if ep:
+            # The pawn that just moved two squares stands beyond the target, and the square it left
+            # and the target itself are empty
+            forward = 10 if side == 'w' else -10
+            if squares[ep] != EMPTY or squares[ep - forward] != EMPTY or \
+                    squares[ep + forward] != (-PAWN if side == 'w' else PAWN):
+                raise ValueError(f'no pawn can just have passed {square_name(ep)}')
+        position = cls(squares, side == 'w', rights, ep, halfmove, fullmove)
+        white = position.white_to_move
+        if is_square_attacked(position, position.kings[not white], white):
+            raise ValueError('the side not to move is in check')
+        return position
+
+    def fen(self):
+        squares = self.squares
+        rows = []
+        for row in range(8):
+            text, empty = '', 0
+            for sq in SQUARES[row * 8:row * 8 + 8]:
+                piece = squares[sq]
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = _PIECE_LETTERS[abs(piece)]
+                text += letter.upper() if piece > 0 else letter
+            rows.append(text + (str(empty) if empty else ''))
+        castling = ''.join(letter for bit, letter in _CASTLING_LETTERS if self.castling & bit) or '-'
+        ep = square_name(self.ep) if self.ep else '-'
+        return f"{'/'.join(rows)} {'w' if self.white_to_move else 'b'} {castling} {ep} {self.halfmove} {self.fullmove}"
+
+    def rows(self):
+        squares = self.squares
+        return [[_PIECES[squares[sq]] for sq in SQUARES[row * 8:row * 8 + 8]] for row in range(8)]
+
+    @property
+    def board(self):
+        # List-of-lists view of flyweight pieces (or None) for the UI
+        return self.rows()
+
+    def copy(self, history=False):
+        # history=True keeps the undo records a repetition could still reach, for a search that must
+        # see the game that led here; they are never popped
+        new = object.__new__(type(self))
+        new.squares = array('b', self.squares)
+        new.white_to_move = self.white_to_move
+        new.castling = self.castling
+        new.ep = self.ep
+        new.halfmove = self.halfmove
+        new.fullmove = self.fullmove
+        new.kings = self.kings[:]
+        new.piece_lists = [self.piece_lists[0].copy(), self.piece_lists[1].copy()]
+        new.key = self.key
+        new.history = self.history[max(len(self.history) - self.halfmove, 0):] if history else []
+        return new
+
+    def piece_at(self, row, col):
+        return _PIECES[self.squares[square(row, col)]]
+
+    def king_square(self, white=True):
+        return self.kings[white]
+
+    def in_check(self):
+        white = self.white_to_move
+        return is_square_attacked(self, self.king_square(white), not white)
+
+    def repetitions(self):
+        # Earlier occurrences of this position in history, looking back only as far as the last
+        # capture or pawn move, since nothing before one can recur
+        history = self.history
+        count = 0
+        for i in range(len(history) - 2, max(len(history) - self.halfmove, 0) - 1, -2):
+            if history[i][_KEY] == self.key:
+                count += 1
+        return count
+
+    def insufficient_material(self):
+        # Neither side can ever mate: bare kings, one minor piece, or bishops all on one colour
+        squares = self.squares
+        others = [sq for side in self.piece_lists for sq in side if abs(squares[sq]) != KING]
+        if len(others) <= 1:
+            return not others or abs(squares[others[0]]) in (KNIGHT, BISHOP)
+        if any(abs(squares[sq]) != BISHOP for sq in others):
+            return False
+        return len({sum(row_col(sq)) % 2 for sq in others}) == 1
+
+    def piece_moves(self, frm, moves):
+        # Append the pseudo-legal moves of the piece on frm, for its own colour
+        squares = self.squares
+        piece = squares[frm]
+        white = piece > 0
+        kind = piece if white else -piece
+        if kind == PAWN:
+            step = -10 if white else 10
+            to = frm + step
+            last_rank = to < 31 if white else to > 90
+            if squares[to] == EMPTY:
+                if last_rank:
+                    moves.extend((frm, to, promotion) for promotion in PROMOTIONS)
+                else:
+                    moves.append((frm, to, EMPTY))
+                    start_rank = frm > 80 if white else frm < 41
+                    if start_rank and squares[to + step] == EMPTY:
+                        moves.append((frm, to + step, EMPTY))
+            for to in (frm + step - 1, frm + step + 1):
+                target = squares[to]
+                if target != EMPTY and target != OFFBOARD and (target > 0) != white:
+                    if last_rank:
+                        moves.extend((frm, to, promotion) for promotion in PROMOTIONS)
+                    else:
+                        moves.append((frm, to, EMPTY))
+                elif to == self.ep and (40 < to < 49 if white else 70 < to < 79):
+                    moves.append((frm, to, EMPTY))
+        elif kind == KNIGHT or kind == KING:
+            for to in KNIGHT_TARGETS[frm] if kind == KNIGHT else KING_TARGETS[frm]:
+                target = squares[to]
+                if target == EMPTY or (target > 0) != white:
+                    moves.append((frm, to, EMPTY))
+            if kind == KING:
+                self._castling_moves(frm, white, moves)
+        else:
+            for ray in SLIDER_RAYS[kind][frm]:
+                for to in ray:
+                    target = squares[to]
+                    if target == EMPTY:
+                        moves.append((frm, to, EMPTY))
+                    else:
+                        if (target > 0) != white:
+                            moves.append((frm, to, EMPTY))
+                        break
+
+    def _castling_moves(self, frm, white, moves):
+        squares = self.squares
         if white:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/white-rook.png'), (80, 80))
+            home, kingside, queenside, rook = 95, WHITE_KINGSIDE, WHITE_QUEENSIDE, ROOK
         else:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/black-rook.png'), (80, 80))
-
-    def get_legal_moves(self, board):
+            home, kingside, queenside, rook = 25, BLACK_KINGSIDE, BLACK_QUEENSIDE, -ROOK
+        if frm != home or not self.castling & (kingside | queenside):
+            return
+        if is_square_attacked(self, home, not white):
+            return
+        if self.castling & kingside and squares[home + 1] == EMPTY and squares[home + 2] == EMPTY \
+                and squares[home + 3] == rook and not is_square_attacked(self, home + 1, not white):
+            moves.append((home, home + 2, EMPTY))
+        if self.castling & queenside and squares[home - 1] == EMPTY and squares[home - 2] == EMPTY \
+                and squares[home - 3] == EMPTY and squares[home - 4] == rook \
+                and not is_square_attacked(self, home - 1, not white):
+            moves.append((home, home - 2, EMPTY))
+
+    def pseudo_legal_moves(self):
+        moves = []
+        for sq in self.piece_lists[self.white_to_move]:
+            self.piece_moves(sq, moves)
+        return moves
+
+    def legal_moves(self):
+        white = self.white_to_move
+        legal = []
+        for move in self.pseudo_legal_moves():
+            self.push(move)
+            if not is_square_attacked(self, self.kings[white], not white):
+                legal.append(move)
+            self.pop()
+        return legal
+
+    def make(self, move):
+        # Return the position after move; self is left untouched
+        new = self.copy()
+        new.push(move)
+        return new
+
+    def push(self, move):
+        # Play move in place, recording what pop needs to take it back
+        frm, to, promotion = move
+        squares = self.squares
+        piece = squares[frm]
+        captured = squares[to]
+        white = piece > 0
+        own, other = self.piece_lists[white], self.piece_lists[not white]
+        self.history.append((move, piece, captured, self.castling, self.ep, self.halfmove, self.key))
+        key = self.key ^ ZOBRIST_PIECES[piece + 6][frm] ^ ZOBRIST_WHITE_TO_MOVE ^ ZOBRIST_EP[self.ep]
+        own.remove(frm)
+        own.add(to)
+        if captured != EMPTY:
+            other.remove(to)
+            key ^= ZOBRIST_PIECES[captured + 6][to]
+        squares[frm] = EMPTY
+        kind = piece if white else -piece
+        ep = self.ep
+        self.ep = 0
+        self.halfmove = 0 if kind == PAWN or captured != EMPTY else self.halfmove + 1
+        if not white:
+            self.fullmove += 1
+        if kind == PAWN:
+            if to == ep:
+                # The captured pawn sits behind the target square
+                behind = to + 10 if white else to - 10
+                squares[behind] = EMPTY
+                other.remove(behind)
+                key ^= ZOBRIST_PIECES[6 - piece][behind]
+            elif (to - frm == 20 or frm - to == 20) and -piece in (squares[to - 1], squares[to + 1]):
+                self.ep = (frm + to) // 2
+                key ^= ZOBRIST_EP[self.ep]
+            if promotion:
+                piece = promotion if white else -promotion
+        elif kind == KING:
+            self.kings[white] = to
+            if to - frm == 2 or frm - to == 2:
+                rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+                rook = squares[rook_from]
+                squares[rook_to] = rook
+                squares[rook_from] = EMPTY
+                own.remove(rook_from)
+                own.add(rook_to)
+                key ^= ZOBRIST_PIECES[rook + 6][rook_from] ^ ZOBRIST_PIECES[rook + 6][rook_to]
+        squares[to] = piece
+        key ^= ZOBRIST_PIECES[piece + 6][to] ^ ZOBRIST_CASTLING[self.castling]
+        self.castling &= _CASTLING_MASK[frm] & _CASTLING_MASK[to]
+        self.key = key ^ ZOBRIST_CASTLING[self.castling]
+        self.white_to_move = not self.white_to_move
+
+    def pop(self):
+        # Take back the last pushed move
+        move, piece, captured, self.castling, self.ep, self.halfmove, self.key = self.history.pop()
+        frm, to, promotion = move
+        squares = self.squares
+        white = piece > 0
+        own, other = self.piece_lists[white], self.piece_lists[not white]
+        self.white_to_move = not self.white_to_move
+        if not white:
+            self.fullmove -= 1
+        squares[frm] = piece
+        squares[to] = captured
+        own.remove(to)
+        own.add(frm)
+        if captured != EMPTY:
+            other.add(to)
+        kind = piece if white else -piece
+        if kind == PAWN:
+            if to == self.ep:
+                behind = to + 10 if white else to - 10
+                squares[behind] = -piece
+                other.add(behind)
+        elif kind == KING:
+            self.kings[white] = frm
+            if to - frm == 2 or frm - to == 2:
+                rook_from, rook_to = (frm + 3, frm + 1) if to > frm else (frm - 4, frm - 1)
+                squares[rook_from] = squares[rook_to]
+                squares[rook_to] = EMPTY
+                own.remove(rook_to)
+                own.add(rook_from)
+
+
+class Piece:
+    # One shared, immutable instance per type and colour; squares live on the board
+    __slots__ = ('white',)
+    name = None
+    kind = EMPTY
+
+    def __new__(cls, white=True):
+        piece = _flyweights.get((cls, white))
+        if piece is None:
+            piece = object.__new__(cls)
+            object.__setattr__(piece, 'white', white)
+            _flyweights[(cls, white)] = piece
+        return piece
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} pieces are immutable')
+
+    def __reduce__(self):
+        return type(self), (self.white,)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.white})"
+
+    @property
+    def code(self):
+        return self.kind if self.white else -self.kind
+
+    def get_legal_moves(self, position, x, y):
+        moves = []
+        position.piece_moves(square(x, y), moves)
         legal_moves = []
-        # Horizontal movement
-        for i in range(self.x - 1, -1, -1):
-            if board[i][self.y] is not None:
-                if board[i][self.y].white != self.white:
-                    legal_moves.append((i, self.y))
-                break
-            legal_moves.append((i, self.y))
-        for i in range(self.x + 1, 8):
-            if board[i][self.y] is not None:
-                if board[i][self.y].white != self.white:
-                    legal_moves.append((i, self.y))
-                break
-            legal_moves.append((i, self.y))
-        # Vertical movement
-        for j in range(self.y - 1, -1, -1):
-            if board[self.x][j] is not None:
-                if board[self.x][j].white != self.white:
-                    legal_moves.append((self.x, j))
-                break
-            legal_moves.append((self.x, j))
-        for j in range(self.y + 1, 8):
-            if board[self.x][j] is not None:
-                if board[self.x][j].white != self.white:
-                    legal_moves.append((self.x, j))
-                break
-            legal_moves.append((self.x, j))
+        for _, to, _ in moves:
+            # Promotions share a target square
+            target = row_col(to)
+            if target not in legal_moves:
+                legal_moves.append(target)
         return legal_moves
 
 
-class Queen:
-    def __init__(self, x, y, white=True):
-        self.x = x
-        self.y = y
-        self.clicked = False
-        self.white = white
-        if white:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/white-queen.png'), (80, 80))
-        else:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/black-queen.png'), (80, 80))
+class Pawn(Piece):
+    __slots__ = ()
+    name = 'pawn'
+    kind = PAWN
 
-    def get_legal_moves(self, board):
-        legal_moves = []
-        # Horizontal movement
-        for i in range(self.x - 1, -1, -1):
-            if board[i][self.y] is not None:
-                if board[i][self.y].white != self.white:
-                    legal_moves.append((i, self.y))
-                break
-            legal_moves.append((i, self.y))
-        for i in range(self.x + 1, 8):
-            if board[i][self.y] is not None:
-                if board[i][self.y].white != self.white:
-                    legal_moves.append((i, self.y))
-                break
-            legal_moves.append((i, self.y))
-        # Vertical movement
-        for j in range(self.y - 1, -1, -1):
-            if board[self.x][j] is not None:
-                if board[self.x][j].white != self.white:
-                    legal_moves.append((self.x, j))
-                break
-            legal_moves.append((self.x, j))
-        for j in range(self.y + 1, 8):
-            if board[self.x][j] is not None:
-                if board[self.x][j].white != self.white:
-                    legal_moves.append((self.x, j))
-                break
-            legal_moves.append((self.x, j))
-        # Diagonal movement
-        for i in range(1, 8):
-            if 0 <= self.x - i < 8 and 0 <= self.y - i < 8:
-                if board[self.x - i][self.y - i] is not None:
-                    if board[self.x - i][self.y - i].white != self.white:
-                        legal_moves.append((self.x - i, self.y - i))
-                    break
-                legal_moves.append((self.x - i, self.y - i))
-        for i in range(1, 8):
-            if 0 <= self.x + i < 8 and 0 <= self.y - i < 8:
-                if board[self.x + i][self.y - i] is not None:
-                    if board[self.x + i][self.y - i].white != self.white:
-                        legal_moves.append((self.x + i, self.y - i))
-                    break
-                legal_moves.append((self.x + i, self.y - i))
-        for i in range(1, 8):
-            if 0 <= self.x - i < 8 and 0 <= self.y + i < 8:
-                if board[self.x - i][self.y + i] is not None:
-                    if board[self.x - i][self.y + i].white != self.white:
-                        legal_moves.append((self.x - i, self.y + i))
-                    break
-                legal_moves.append((self.x - i, self.y + i))
-        for i in range(1, 8):
-            if 0 <= self.x + i < 8 and 0 <= self.y + i < 8:
-                if board[self.x + i][self.y + i] is not None:
-                    if board[self.x + i][self.y + i].white != self.white:
-                        legal_moves.append((self.x + i, self.y + i))
-                    break
-                legal_moves.append((self.x + i, self.y + i))
-        return legal_moves
 
+class Rook(Piece):
+    __slots__ = ()
+    name = 'rook'
+    kind = ROOK
 
-class King:
-    def __init__(self, x, y, white=True):
-        self.x = x
-        self.y = y
-        self.clicked = False
-        self.has_moved = False
-        self.white = white
-        if white:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/white-king.png'), (80, 80))
-        else:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/black-king.png'), (80, 80))
 
-    def get_legal_moves(self, board):
-        legal_moves = []
+class Queen(Piece):
+    __slots__ = ()
+    name = 'queen'
+    kind = QUEEN
 
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if i == 0 and j == 0:
-                    continue
-                if 0 <= self.x + i < 8 and 0 <= self.y + j < 8:
-                    if board[self.x + i][self.y + j] is None or board[self.x + i][self.y + j].white != self.white:
-                        tmp_board = make_move(board, (self.x + i, self.y + j), (self.x, self.y))
-                        if not in_check(tmp_board, self.x + i, self.y + j, self.white):
-                            legal_moves.append((self.x + i, self.y + j))
-
-        #Check for castling
-
-        if not self.has_moved:
-            if self.white:
-                if board[7][5] is None and board[7][6] is None and type(board[7][7]) is Rook:
-                    legal_moves.append((7, 6))
-                if board[7][3] is None and board[7][2] is None and board[7][1] is None and type(board[7][0]) is Rook:
-                    legal_moves.append((7, 2))
-            else:
-                if board[0][5] is None and board[0][6] is None and type(board[0][7]) is Rook:
-                    legal_moves.append((0, 6))
-                if board[0][3] is None and board[0][2] is None and board[0][1] is None and type(board[0][0]) is Rook:
-                    legal_moves.append((0, 2))
 
-        return legal_moves
+class King(Piece):
+    __slots__ = ()
+    name = 'king'
+    kind = KING
 
-    def is_castle(self, future_x, future_y):
-        if self.has_moved:
-            return False
+    def get_legal_moves(self, position, x, y):
+        # Unlike other pieces the king never offers a square that leaves it in check
+        return [(i, j) for i, j in super().get_legal_moves(position, x, y)
+                if is_check_resolved(position, (j, i), (x, y), self.white)]
 
-        if future_x == 7 and future_y == 6:  # Castling kingside
-            return True
-        elif future_x == 7 and future_y == 2:  # Castling queenside
-            return True
-        elif future_x == 0 and future_y == 6:  # Castling kingside (black)
-            return True
-        elif future_x == 0 and future_y == 2:  # Castling queenside (black)
-            return True
 
-        return False
+class Bishop(Piece):
+    __slots__ = ()
+    name = 'bishop'
+    kind = BISHOP
 
-class Bishop:
-    def __init__(self, x, y, white=True):
-        self.x = x
-        self.y = y
-        self.clicked = False
-        self.white = white
-        if white:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/white-bishop.png'), (80, 80))
-        else:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/black-bishop.png'), (80, 80))
 
-    def get_legal_moves(self, board):
-        legal_moves = []
-        # Diagonal movement
-        # Top-left diagonal
-        for i in range(1, min(self.x, self.y) + 1):
-            if board[self.x - i][self.y - i] is None:
-                legal_moves.append((self.x - i, self.y - i))
-            elif board[self.x - i][self.y - i].white != self.white:
-                legal_moves.append((self.x - i, self.y - i))
-                break
-            else:
-                break
-        # Top-right diagonal
-        for i in range(1, min(self.x, 7 - self.y) + 1):
-            if board[self.x - i][self.y + i] is None:
-                legal_moves.append((self.x - i, self.y + i))
-            elif board[self.x - i][self.y + i].white != self.white:
-                legal_moves.append((self.x - i, self.y + i))
-                break
-            else:
-                break
-        # Bottom-left diagonal
-        for i in range(1, min(7 - self.x, self.y) + 1):
-            if board[self.x + i][self.y - i] is None:
-                legal_moves.append((self.x + i, self.y - i))
-            elif board[self.x + i][self.y - i].white != self.white:
-                legal_moves.append((self.x + i, self.y - i))
-                break
-            else:
-                break
-        # Bottom-right diagonal
-        for i in range(1, min(7 - self.x, 7 - self.y) + 1):
-            if board[self.x + i][self.y + i] is None:
-                legal_moves.append((self.x + i, self.y + i))
-            elif board[self.x + i][self.y + i].white != self.white:
-                legal_moves.append((self.x + i, self.y + i))
-                break
-            else:
-                break
-        return legal_moves
+class Knight(Piece):
+    __slots__ = ()
+    name = 'knight'
+    kind = KNIGHT
 
 
-class Knight:
-    def __init__(self, x, y, white=True):
-        self.x = x
-        self.y = y
-        self.clicked = False
-        self.white = white
-        if white:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/white-knight.png'), (80, 80))
-        else:
-            self.img = pygame.transform.smoothscale(pygame.image.load('pieces-basic-png/black-knight.png'), (80, 80))
+# Piece code -> flyweight, None for an empty square
+_PIECES = {EMPTY: None}
+for _cls in (Pawn, Knight, Bishop, Rook, Queen, King):
+    _PIECES[_cls.kind] = _cls(True)
+    _PIECES[-_cls.kind] = _cls(False)
+
+_START_SQUARES = Position.from_rows([
+    [Rook(False), Knight(False), Bishop(False), Queen(False), King(False), Bishop(False), Knight(False), Rook(False)],
+    [Pawn(False)] * 8,
+    [None] * 8,
+    [None] * 8,
+    [None] * 8,
+    [None] * 8,
+    [Pawn(True)] * 8,
+    [Rook(True), Knight(True), Bishop(True), Queen(True), King(True), Bishop(True), Knight(True), Rook(True)]
+]).squares
 
-    def get_legal_moves(self, board):
-        legal_moves = []
-        # Knight movement pattern
-        moves = [
-            (self.x - 1, self.y - 2), (self.x + 1, self.y - 2),
-            (self.x - 2, self.y - 1), (self.x + 2, self.y - 1),
-            (self.x - 2, self.y + 1), (self.x + 2, self.y + 1),
-            (self.x - 1, self.y + 2), (self.x + 1, self.y + 2)
-        ]
-        # Filter out moves outside the board
-        for x, y in moves:
-            if 0 <= x < 8 and 0 <= y < 8:
-                if board[x][y] is None or board[x][y].white != self.white:
-                    legal_moves.append((x, y))
-        return legal_moves
 
+class Board(Position):
+    # The standard starting position
+    __slots__ = ()
 
-class Board:
     def __init__(self):
-        self.board = [
-            [Rook(0, 0, False), Knight(0, 1, False), Bishop(0, 2, False), Queen(0, 3, False), King(0, 4, False),
-             Bishop(0, 5, False), Knight(0, 6, False), Rook(0, 7, False)],
-            [Pawn(1, 0, False), Pawn(1, 1, False), Pawn(1, 2, False), Pawn(1, 3, False), Pawn(1, 4, False),
-             Pawn(1, 5, False), Pawn(1, 6, False), Pawn(1, 7, False)],
-            [None] * 8,
-            [None] * 8,
-            [None] * 8,
-            [None] * 8,
-            [Pawn(6, 0, True), Pawn(6, 1, True), Pawn(6, 2, True), Pawn(6, 3, True), Pawn(6, 4, True), Pawn(6, 5, True),
-             Pawn(6, 6, True), Pawn(6, 7, True)],
-            [Rook(7, 0, True), Knight(7, 1, True), Bishop(7, 2, True), Queen(7, 3, True), King(7, 4, True),
-             Bishop(7, 5, True), Knight(7, 6, True), Rook(7, 7, True)]
-        ]
+        super().__init__(array('b', _START_SQUARES))
@@ -0,0 +1,77 @@
+import time
+
+import pygame
+
+import metrics
+import pieces
+from sprites import get_sprite
+
+SCREEN_WIDTH = 640
+SCREEN_HEIGHT = 640
+BLOCKSIZE = 640 // 8
+LIGHT = (233, 215, 182)
+DARK = (171, 136, 102)
+YELLOW = (255, 218, 112)
+RED = (255, 0, 0)
+LIGHT_YELLOW = ((255 * 2 + 233) // 3, (218 * 2 + 215) // 3, (112 * 2 + 182) // 3)
+DARK_YELLOW = ((255 * 2 + 171) // 3, (218 * 2 + 136) // 3, (112 * 2 + 102) // 3)
+
+
+class BoardRenderer:
+    # Keeps the checkerboard as one pre-rendered surface and remembers what each square shows,
+    # so a frame only repaints and pushes to the display the squares that changed
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        for row in range(8):
+            for col in range(8):
+                rect = pygame.rect.Rect(col * BLOCKSIZE, row * BLOCKSIZE, BLOCKSIZE, BLOCKSIZE)
+                pygame.draw.rect(self.background, LIGHT if (row + col) % 2 == 0 else DARK, rect)
+        # (piece code, highlight colour) last drawn on each square, None forces a repaint
+        self.drawn = [None] * 64
+
+    def invalidate(self):
+        # Repaint everything on the next draw, e.g. after the window was covered
+        self.drawn = [None] * 64
+
+    def draw(self, position, selected=None, targets=(), check=None):
+        # selected, targets and check are (row, col) squares; returns the rects pushed to the display
+        squares = position.squares
+        dirty = []
+        for i, sq in enumerate(pieces.SQUARES):
+            row, col = divmod(i, 8)
+            if (row, col) == check:
+                shade = RED
+            elif (row, col) == selected or (row, col) in targets:
+                shade = LIGHT_YELLOW if (row + col) % 2 == 0 else DARK_YELLOW
+            else:
+                shade = None
+            look = (squares[sq], shade)
+            if look == self.drawn[i]:
+                continue
+            self.drawn[i] = look
+            rect = pygame.rect.Rect(col * BLOCKSIZE, row * BLOCKSIZE, BLOCKSIZE, BLOCKSIZE)
+            if shade:
+                pygame.draw.rect(self.screen, shade, rect)
+            else:
+                self.screen.blit(self.background, rect, rect)
+            piece = position.piece_at(row, col)
+            if piece:
+                img = get_sprite(piece.name, piece.white)
+                self.screen.blit(img, img.get_rect(center=rect.center))
+            dirty.append(rect)
+        if dirty:
+            pygame.display.update(dirty)
+        return dirty
+
+
+def draw(renderer, game_state, piece_clicked, legal_moves):
+    # One frame of a game.GameState for the frontends: piece_clicked is the selected piece's
+    # (col, row) and legal_moves its (row, col) targets
+    start = time.perf_counter()
+    renderer.draw(game_state.position,
+                  selected=(piece_clicked[1], piece_clicked[0]) if piece_clicked else None,
+                  targets=legal_moves or (),
+                  check=game_state.king_square() if game_state.in_check else None)
+    metrics.observe(metrics.frame_seconds, start)
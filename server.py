@@ -0,0 +1,253 @@
+import argparse
+import os
+import threading
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+import book
+import game
+import metrics
+import pieces
+import tablebase
+from sessions import SessionManager
+
+app = Flask(__name__)
+app.json.compact = True
+
+# The shared game. Every read or write of it, from HTTP handlers or the pygame loop, holds lock.
+lock = threading.RLock()
+state = game.GameState(tablebase=tablebase.open_tablebase(os.environ.get('CHESS_TABLEBASES')))
+# Called after a game changes with the ID of the hosted game, or None for the shared game above,
+# e.g. to wake the pygame loop or push the move to spectators
+listeners = []
+# Independent games hosted under /games, for clients that do not share the board above;
+# CHESS_MAX_GAMES_MB caps the memory they may take as well as their number
+sessions = SessionManager(max_games=int(os.environ.get('CHESS_MAX_GAMES', '10000')),
+                          idle_timeout=float(os.environ.get('CHESS_IDLE_TIMEOUT', '1800')),
+                          max_bytes=int(float(os.environ['CHESS_MAX_GAMES_MB']) * 1024 * 1024)
+                          if os.environ.get('CHESS_MAX_GAMES_MB') else None)
+# Opening book from CHESS_BOOK, shared with every other process that maps the same file
+opening_book = book.open_book(os.environ.get('CHESS_BOOK'))
+
+
+def notify(game_id=None):
+    for listener in listeners:
+        listener(game_id)
+
+
+def status(result, in_check):
+    # How the game ended (see game.outcome), else check or ongoing
+    return result or ('check' if in_check else 'ongoing')
+
+
+def winner(result, white_to_move):
+    return ('black' if white_to_move else 'white') if result == game.CHECKMATE else None
+
+
+def tablebase_json(known):
+    # The tablebase result for the side to move, or None for a position the tables do not cover
+    if known is None:
+        return None
+    result, plies = known
+    return {'result': {1: 'win', 0: 'draw', -1: 'loss'}[result], 'plies': plies}
+
+
+def position_json(game_state):
+    return {
+        'fen': game_state.position.fen(),
+        'turn': 'white' if game_state.white_to_move else 'black',
+        'status': status(game_state.outcome, game_state.in_check),
+        'winner': winner(game_state.outcome, game_state.white_to_move),
+        'moves': [pieces.uci(move) for move in game_state.moves],
+        'tablebase': tablebase_json(game_state.tablebase_result),
+    }
+
+
+def session_json(session, legal_moves=None):
+    position = session.position
+    result = session.outcome(legal_moves if legal_moves is not None else session.legal_moves())
+    return {
+        'id': session.id,
+        'fen': position.fen(),
+        'turn': 'white' if position.white_to_move else 'black',
+        'status': status(result, position.in_check()),
+        'winner': winner(result, position.white_to_move),
+        'moves': session.uci_moves(),
+    }
+
+
+def find_uci(game_state, text):
+    for move in game_state.legal_moves:
+        if pieces.uci(move) == text:
+            return move
+    return None
+
+
+def request_fields():
+    # The JSON object or form fields of the request body, or None when the JSON is not an object
+    data = request.get_json(silent=True) if request.is_json else request.form
+    return data if isinstance(data, dict) else None
+
+
+def move_text():
+    # A move is sent as JSON {"move": "e2e4"} or a form field of the same name, in UCI notation
+    data = request_fields() or {}
+    return str(data.get('move', '')).strip().lower()
+
+
+def book_json(position):
+    if opening_book is None:
+        return {'moves': [], 'choice': None}
+    found = opening_book.entries(position)
+    choice = book.pick(found)
+    return {
+        'moves': [{'move': pieces.uci(move), 'weight': weight} for move, weight in found],
+        'choice': pieces.uci(choice) if choice else None,
+    }
+
+
+def unknown_game(game_id):
+    return jsonify(error=f'no such game: {game_id}'), 404
+
+
+@app.route('/send_text', methods=['POST'])
+def receive_text():
+    text = request.form['text']
+    print("Received Text:", text)
+    # Process the text as needed
+    return 'Text received successfully!'
+
+
+@app.route('/position')
+def get_position():
+    with lock:
+        return jsonify(position_json(state))
+
+
+@app.route('/legal_moves')
+def get_legal_moves():
+    with lock:
+        return jsonify(moves=[pieces.uci(move) for move in state.legal_moves])
+
+
+@app.route('/move', methods=['POST'])
+def post_move():
+    text = move_text()
+    with lock:
+        if state.game_over:
+            return jsonify(error='the game is over', **position_json(state)), 400
+        move = find_uci(state, text)
+        if move is None:
+            return jsonify(error=f'illegal move: {text}', **position_json(state)), 400
+        state.apply(move)
+        body = position_json(state)
+    notify()
+    return jsonify(body)
+
+
+@app.route('/book')
+def get_book():
+    # Book moves for the shared game and one picked by weight; choice is null when out of book
+    with lock:
+        return jsonify(book_json(state.position))
+
+
+@app.route('/new_game', methods=['POST'])
+def post_new_game():
+    with lock:
+        state.reset()
+        body = position_json(state)
+    notify()
+    return jsonify(body)
+
+
+@app.route('/metrics')
+def get_metrics():
+    # Prometheus text format; the hot-path timers only count when CHESS_METRICS is set
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/games', methods=['POST'])
+def post_games():
+    # Optional JSON {"fen": ...} to start from a given position
+    data = request_fields()
+    if data is None:
+        return jsonify(error='the body must be a JSON object'), 400
+    fen = data.get('fen')
+    if fen is not None and not isinstance(fen, str):
+        return jsonify(error='fen must be a string'), 400
+    try:
+        session = sessions.create(fen)
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    with session.lock:
+        return jsonify(session_json(session)), 201
+
+
+@app.route('/games/<game_id>')
+def get_game(game_id):
+    session = sessions.get(game_id)
+    if session is None:
+        return unknown_game(game_id)
+    with session.lock:
+        return jsonify(session_json(session))
+
+
+@app.route('/games/<game_id>/legal_moves')
+def get_game_legal_moves(game_id):
+    session = sessions.get(game_id)
+    if session is None:
+        return unknown_game(game_id)
+    with session.lock:
+        return jsonify(moves=[pieces.uci(move) for move in session.legal_moves()])
+
+
+@app.route('/games/<game_id>/book')
+def get_game_book(game_id):
+    session = sessions.get(game_id)
+    if session is None:
+        return unknown_game(game_id)
+    with session.lock:
+        return jsonify(book_json(session.position))
+
+
+@app.route('/games/<game_id>/move', methods=['POST'])
+def post_game_move(game_id):
+    session = sessions.get(game_id)
+    if session is None:
+        return unknown_game(game_id)
+    text = move_text()
+    with session.lock:
+        legal = session.legal_moves()
+        if session.outcome(legal):
+            return jsonify(error='the game is over', **session_json(session, legal)), 400
+        move = session.find_uci(text, legal)
+        if move is None:
+            return jsonify(error=f'illegal move: {text}', **session_json(session, legal)), 400
+        session.apply(move)
+        body = session_json(session)
+    notify(game_id)
+    return jsonify(body)
+
+
+@app.route('/games/<game_id>', methods=['DELETE'])
+def delete_game(game_id):
+    if not sessions.delete(game_id):
+        return unknown_game(game_id)
+    notify(game_id)
+    return '', 204
+
+
+def main():
+    # Serve the API with no board window, e.g. on a machine without a display
+    parser = argparse.ArgumentParser(description='Serve the chess HTTP API without a display.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=4444)
+    args = parser.parse_args()
+    metrics.setup()
+    make_server(args.host, args.port, app, threaded=True).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import game
+import pieces
+
+# Bytes a hosted game is budgeted at, a little over what benchmarks/session_load.py measures for a
+# game 40 or 100 random moves in (about 6 KB); a memory cap becomes a game count through it
+GAME_BYTES = 8192
+
+
+class Session:
+    # One hosted game: the current position and the moves that led to it, packed with
+    # pieces.encode_move. Nothing is cached between requests, so an idle game costs little more
+    # than its board and the undo records since the last capture or pawn move.
+    __slots__ = ('id', 'position', 'moves', 'last_used', 'lock')
+
+    def __init__(self, id, position):
+        self.id = id
+        self.position = position
+        self.moves = array('i')
+        self.last_used = time.monotonic()
+        # Held while reading or changing this game; sessions do not block one another
+        self.lock = threading.Lock()
+
+    def legal_moves(self):
+        return self.position.legal_moves()
+
+    def outcome(self, legal_moves):
+        return game.outcome(self.position, legal_moves, self.position.in_check())
+
+    def find_uci(self, text, legal_moves):
+        for move in legal_moves:
+            if pieces.uci(move) == text:
+                return move
+        return None
+
+    def apply(self, move):
+        position = self.position
+        position.push(move)
+        # Sessions never take a move back, so only the undo records a repetition could reach
+        # are kept, at most a hundred plies' worth
+        del position.history[:len(position.history) - position.halfmove]
+        self.moves.append(pieces.encode_move(move))
+
+    def uci_moves(self):
+        return [pieces.uci(pieces.decode_move(code)) for code in self.moves]
+
+
+class SessionManager:
+    # Games by ID, most recently used last. A game untouched for idle_timeout seconds expires, and
+    # creating a game beyond max_games evicts the one idle the longest. max_bytes, when given, caps
+    # memory too: it allows max_bytes // GAME_BYTES games, and the smaller of the two caps applies.
+
+    def __init__(self, max_games=10000, idle_timeout=1800.0, max_bytes=None):
+        if max_bytes is not None:
+            max_games = min(max_games, max(1, max_bytes // GAME_BYTES))
+        self.max_games = max_games
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, fen=None):
+        try:
+            position = pieces.Position.from_fen(fen) if fen else pieces.Board()
+        except ValueError as error:
+            raise ValueError(f'bad FEN: {error}') from None
+        with self.lock:
+            self._expire(time.monotonic())
+            while len(self.sessions) >= self.max_games:
+                self.sessions.popitem(last=False)
+            session = Session(secrets.token_urlsafe(9), position)
+            self.sessions[session.id] = session
+        return session
+
+    def get(self, id):
+        # The live session with this ID, or None; a hit counts as use
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.get(id)
+            if session is None:
+                return None
+            if now - session.last_used > self.idle_timeout:
+                del self.sessions[id]
+                return None
+            session.last_used = now
+            self.sessions.move_to_end(id)
+        return session
+
+    def delete(self, id):
+        with self.lock:
+            return self.sessions.pop(id, None) is not None
+
+    def expire(self):
+        # Drop every idle game now; returns how many went
+        with self.lock:
+            return self._expire(time.monotonic())
+
+    def _expire(self, now):
+        expired = 0
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_used <= self.idle_timeout:
+                break
+            self.sessions.popitem(last=False)
+            expired += 1
+        return expired
+
+    def __len__(self):
+        return len(self.sessions)
@@ -0,0 +1,23 @@
+import os
+
+import pygame
+
+SPRITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pieces-basic-png')
+SPRITE_SIZE = (80, 80)
+
+# Process-wide atlas: (name, white) -> scaled surface, filled lazily on first use
+_atlas = {}
+
+
+def get_sprite(name, white=True):
+    key = (name, white)
+    img = _atlas.get(key)
+    if img is None:
+        path = os.path.join(SPRITE_DIR, f"{'white' if white else 'black'}-{name}.png")
+        img = pygame.transform.smoothscale(pygame.image.load(path), SPRITE_SIZE)
+        _atlas[key] = img
+    return img
+
+
+def clear_sprites():
+    _atlas.clear()
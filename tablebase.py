@@ -0,0 +1,366 @@
+"""Endgame tablebases: distance to mate for every position with at most four pieces.
+
+Build tables by retrograde analysis, smaller material first:
+    python tablebase.py KQvK KRvK KPvK [-d tables]
+    python tablebase.py --all 3 [-d tables]
+"""
+import argparse
+import mmap
+import os
+import time
+from array import array
+
+import pieces
+from pieces import EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, OFFBOARD
+
+MAX_PIECES = 4
+# One byte per position and side to move: DRAW, ILLEGAL, or one more than the plies to mate.
+# An odd ply count means the side to move mates, an even one that it gets mated.
+DRAW = 0
+ILLEGAL = 255
+_LETTERS = {KING: 'K', QUEEN: 'Q', ROOK: 'R', BISHOP: 'B', KNIGHT: 'N', PAWN: 'P'}
+_KINDS = {letter: kind for kind, letter in _LETTERS.items()}
+# Material that cannot mate, so needs no table
+_DEAD = ('KvK', 'KBvK', 'KNvK')
+
+
+def _transform(index, flip_file, flip_rank, swap):
+    # A 64-square index under a board symmetry; swap reflects in the a1-h8 diagonal
+    row, col = divmod(index, 8)
+    rank, file = 7 - row, col
+    if flip_file:
+        file = 7 - file
+    if flip_rank:
+        rank = 7 - rank
+    if swap:
+        rank, file = file, rank
+    return (7 - rank) * 8 + file
+
+
+_SYMMETRIES = {(f, r, s): [_transform(i, f, r, s) for i in range(64)]
+               for f in (False, True) for r in (False, True) for s in (False, True)}
+# White king squares kept after symmetry: a1-d1-d4 without pawns, files a-d with them
+_TRIANGLE = [i for i in range(64) if (7 - i // 8) <= i % 8 <= 3]
+_HALF = [i for i in range(64) if i % 8 <= 3]
+_TRIANGLE_INDEX = {sq: n for n, sq in enumerate(_TRIANGLE)}
+_HALF_INDEX = {sq: n for n, sq in enumerate(_HALF)}
+
+
+def signature(codes):
+    # Material name such as KQvKR for a list of signed piece codes
+    white = sorted((code for code in codes if code > 0), reverse=True)
+    black = sorted((-code for code in codes if code < 0), reverse=True)
+    return ''.join(_LETTERS[kind] for kind in white) + 'v' + ''.join(_LETTERS[kind] for kind in black)
+
+
+def parse_signature(name):
+    # Signed piece codes in table order: white king, white pieces strongest first, then black
+    white, black = name.upper().split('V')
+    white = sorted((_KINDS[letter] for letter in white), reverse=True)
+    black = sorted((_KINDS[letter] for letter in black), reverse=True)
+    if white[0] != KING or black[0] != KING or white.count(KING) + black.count(KING) != 2:
+        raise ValueError(f'bad material: {name}')
+    return tuple(white) + tuple(-kind for kind in black)
+
+
+def _stored(name):
+    # The name the table for this material is kept under, and whether colours must be swapped
+    white, black = name.split('v')
+    strength = (len(white), sorted(map('PNBRQK'.index, white), reverse=True))
+    other = (len(black), sorted(map('PNBRQK'.index, black), reverse=True))
+    return (f'{black}v{white}', True) if other > strength else (name, False)
+
+
+class Table:
+    # Squares of the pieces of one material, in the order of its signature, to and from an index
+
+    def __init__(self, name):
+        self.name = name
+        self.codes = parse_signature(name)
+        self.pawns = any(abs(code) == PAWN for code in self.codes)
+        self.size = (len(_HALF) if self.pawns else len(_TRIANGLE)) * 64 ** (len(self.codes) - 1)
+
+    def index(self, squares):
+        # Index of the symmetry-reduced form of squares, a list of 64-square indexes
+        king = squares[0]
+        row, col = divmod(king, 8)
+        flip_file = col > 3
+        if self.pawns:
+            mapping = _SYMMETRIES[flip_file, False, False]
+            squares = [mapping[sq] for sq in squares]
+            index = _HALF_INDEX[squares[0]]
+        else:
+            flip_rank = row < 4
+            rank, file = 7 - row, col
+            rank, file = (7 - rank if flip_rank else rank), (7 - file if flip_file else file)
+            swap = rank > file
+            mapping = _SYMMETRIES[flip_file, flip_rank, swap]
+            squares = [mapping[sq] for sq in squares]
+            if 7 - squares[0] // 8 == squares[0] % 8:
+                # The king is on the diagonal, which the first piece off it decides
+                for sq in squares[1:]:
+                    rank, file = 7 - sq // 8, sq % 8
+                    if rank != file:
+                        if rank > file:
+                            mapping = _SYMMETRIES[False, False, True]
+                            squares = [mapping[s] for s in squares]
+                        break
+            index = _TRIANGLE_INDEX[squares[0]]
+        for sq in squares[1:]:
+            index = index * 64 + sq
+        return index
+
+    def squares(self, index):
+        squares = []
+        for _ in range(len(self.codes) - 1):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        squares.append((_HALF if self.pawns else _TRIANGLE)[index])
+        return squares[::-1]
+
+
+class Tablebase:
+    # Probes tables in a directory, each mapped into memory on first use. Tables being generated are
+    # held in memory here too, so larger ones can look up the positions their captures reach.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, name):
+        # (Table, data) for a stored material name, or None when it has not been built
+        if name not in self.tables:
+            path = os.path.join(self.directory, name + '.tbl')
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.tables[name] = (Table(name), data)
+        return self.tables[name]
+
+    def lookup(self, squares, white_to_move):
+        # Raw table byte for the pieces on a mailbox, from the side to move; None without a table
+        found = [(squares[sq], i) for i, sq in enumerate(pieces.SQUARES) if squares[sq] != EMPTY]
+        return self._lookup(found, white_to_move)
+
+    def _lookup(self, found, white_to_move):
+        name, swapped = _stored(signature([code for code, _ in found]))
+        if name in _DEAD:
+            return DRAW
+        if swapped:
+            # Swap colours and turn the board over so the table's white pieces are the stronger ones
+            found = [(-code, (7 - i // 8) * 8 + i % 8) for code, i in found]
+            white_to_move = not white_to_move
+        entry = self.table(name)
+        if entry is None:
+            return None
+        table, data = entry
+        found.sort(key=lambda item: -item[0] if item[0] > 0 else 100 + item[0])
+        side = 0 if white_to_move else table.size
+        return data[side + table.index([i for _, i in found])]
+
+    def probe(self, position):
+        # (result, plies to mate) for the side to move, result 1 a win, 0 a draw and -1 a loss, or
+        # None when the position has too many pieces, castling rights or an en-passant square
+        if position.castling or position.ep or \
+                len(position.piece_lists[0]) + len(position.piece_lists[1]) > MAX_PIECES:
+            return None
+        squares = position.squares
+        found = [(squares[sq], pieces.INDEX64[sq]) for side in position.piece_lists for sq in side]
+        value = self._lookup(found, position.white_to_move)
+        if value is None or value == ILLEGAL:
+            return None
+        if value == DRAW:
+            return 0, 0
+        plies = value - 1
+        return (1 if plies % 2 else -1), plies
+
+
+def open_tablebase(directory):
+    # The tables in directory, or None when directory is empty, so callers can take it from the environment
+    return Tablebase(directory) if directory else None
+
+
+def _predecessors(table, squares, white_to_move):
+    # Indexes of the positions in the same table from which the side that just moved reached squares,
+    # without a capture or a promotion
+    board = array('b', [OFFBOARD] * 120)
+    for sq in pieces.SQUARES:
+        board[sq] = EMPTY
+    codes = table.codes
+    for code, i in zip(codes, squares):
+        board[pieces.SQUARES[i]] = code
+    mover = not white_to_move
+    found = set()
+    for n, (code, i) in enumerate(zip(codes, squares)):
+        if (code > 0) != mover:
+            continue
+        kind = abs(code)
+        sq = pieces.SQUARES[i]
+        origins = []
+        if kind == PAWN:
+            back = 10 if mover else -10
+            if board[sq + back] == EMPTY:
+                origin_row = pieces.row_col(sq + back)[0]
+                if origin_row != (7 if mover else 0):
+                    origins.append(sq + back)
+                if origin_row == (5 if mover else 2) and board[sq + 2 * back] == EMPTY:
+                    origins.append(sq + 2 * back)
+        elif kind == KNIGHT or kind == KING:
+            origins = [origin for origin in (pieces.KNIGHT_TARGETS if kind == KNIGHT else pieces.KING_TARGETS)[sq]
+                       if board[origin] == EMPTY]
+        else:
+            for ray in pieces.SLIDER_RAYS[kind][sq]:
+                for origin in ray:
+                    if board[origin] != EMPTY:
+                        break
+                    origins.append(origin)
+        for origin in origins:
+            before = list(squares)
+            before[n] = pieces.INDEX64[origin]
+            found.add(table.index(before))
+    return found
+
+
+def generate(name, tablebase):
+    # Solve one material by retrograde analysis; returns the table bytes, white to move then black.
+    # Every material a capture or promotion can reach must already be in tablebase. Positions are
+    # solved without castling or en passant.
+    table = Table(name)
+    size = table.size
+    values = bytearray(size * 2)
+    # Per position: distinct unsolved moves within the table, whether a capture or promotion draws or
+    # wins, and the longest loss a capture or promotion leads to
+    remaining = bytearray(size * 2)
+    safe_exit = bytearray(size * 2)
+    loss_exit = bytearray(size * 2)
+    buckets = {}
+
+    def schedule(plies, slot):
+        buckets.setdefault(plies, []).append(slot)
+
+    for white_to_move in (True, False):
+        side = 0 if white_to_move else size
+        for index in range(size):
+            slot = side + index
+            squares = table.squares(index)
+            if len(set(squares)) != len(squares) or table.index(squares) != index or \
+                    any(abs(code) == PAWN and not 8 <= sq < 56 for code, sq in zip(table.codes, squares)):
+                values[slot] = ILLEGAL
+                continue
+            board = array('b', [OFFBOARD] * 120)
+            for sq in pieces.SQUARES:
+                board[sq] = EMPTY
+            for code, sq in zip(table.codes, squares):
+                board[pieces.SQUARES[sq]] = code
+            position = pieces.Position(board, white_to_move, castling=0)
+            if pieces.is_square_attacked(position, position.kings[not white_to_move], white_to_move):
+                values[slot] = ILLEGAL
+                continue
+
+            moves = position.legal_moves()
+            if not moves:
+                if position.in_check():
+                    schedule(0, slot)
+                continue
+            order = {pieces.SQUARES[sq]: n for n, sq in enumerate(squares)}
+            inside = set()
+            best_win = None
+            for move in moves:
+                frm, to, promotion = move
+                if board[to] == EMPTY and not promotion:
+                    after = list(squares)
+                    after[order[frm]] = pieces.INDEX64[to]
+                    inside.add(table.index(after))
+                    continue
+                position.push(move)
+                value = tablebase.lookup(position.squares, position.white_to_move)
+                if value is None:
+                    codes = [position.squares[sq] for side in position.piece_lists for sq in side]
+                    raise ValueError(f'{name} needs the table for {signature(codes)}')
+                position.pop()
+                if value == DRAW:
+                    safe_exit[slot] = 1
+                elif (value - 1) % 2 == 0:
+                    best_win = value if best_win is None else min(best_win, value)
+                else:
+                    loss_exit[slot] = max(loss_exit[slot], value)
+            remaining[slot] = len(inside)
+            if best_win is not None:
+                safe_exit[slot] = 1
+                schedule(best_win, slot)
+            elif not inside and not safe_exit[slot]:
+                schedule(loss_exit[slot], slot)
+
+    plies = 0
+    while buckets:
+        for slot in buckets.pop(plies, ()):
+            if values[slot]:
+                continue
+            values[slot] = plies + 1
+            white_to_move = slot < size
+            index = slot if white_to_move else slot - size
+            other = size if white_to_move else 0
+            for before in _predecessors(table, table.squares(index), white_to_move):
+                earlier = other + before
+                if values[earlier]:
+                    continue
+                if plies % 2 == 0:
+                    # A move into a lost position wins
+                    schedule(plies + 1, earlier)
+                else:
+                    remaining[earlier] -= 1
+                    if remaining[earlier] == 0 and not safe_exit[earlier]:
+                        # Every move loses; the longest loss is the one to play
+                        schedule(max(plies + 1, loss_exit[earlier]), earlier)
+        plies += 1
+    return bytes(values)
+
+
+def build(names, directory):
+    os.makedirs(directory, exist_ok=True)
+    tablebase = Tablebase(directory)
+    for name in names:
+        name, _ = _stored(signature(parse_signature(name)))
+        if name in _DEAD:
+            continue
+        start = time.perf_counter()
+        data = generate(name, tablebase)
+        with open(os.path.join(directory, name + '.tbl'), 'wb') as f:
+            f.write(data)
+        tablebase.tables[name] = (Table(name), data)
+        print(f'{name}: {len(data)} bytes in {time.perf_counter() - start:.1f} s')
+
+
+def all_materials(count):
+    # Every material of up to count pieces that needs a table, each after those it can convert into
+    names = set()
+    kinds = (QUEEN, ROOK, BISHOP, KNIGHT, PAWN)
+
+    def extend(prefix, left):
+        yield prefix
+        if left:
+            for kind in kinds:
+                if not prefix or kind <= prefix[-1]:
+                    yield from extend(prefix + (kind,), left - 1)
+
+    for white in extend((), count - 2):
+        for black in extend((), count - 2 - len(white)):
+            name = signature((KING,) + white + (-KING,) + tuple(-kind for kind in black))
+            name, _ = _stored(name)
+            if name not in _DEAD:
+                names.add(name)
+    return sorted(names, key=lambda name: (len(name), name.count('P'), name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*')
+    parser.add_argument('--all', type=int, choices=(3, 4), help='every material with up to this many pieces')
+    parser.add_argument('-d', '--directory', default='tables')
+    args = parser.parse_args(argv)
+    build(args.names or all_materials(args.all or 3), args.directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""Engine-versus-engine matches played headlessly over a process pool, with Elo and SPRT.
+
+Games are played in pairs from the same randomised opening with colours swapped. Each side is a
+spec of comma-separated settings: name, time (seconds per move), nodes, depth, tt (MB) and
+eval (module:function, a replacement for engine.evaluate). Settings left out of a spec come
+from the match-wide options.
+
+    python tournament.py -g 1000 -j 4 --nodes 20000 -o games.pgn
+    python tournament.py --engine2 name=new,eval=myeval:evaluate --sprt 0 10
+"""
+import argparse
+import datetime
+import importlib
+import itertools
+import math
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import book
+import engine
+import game
+import pgn
+import pieces
+
+# Games still going after this many plies are scored as draws
+MAX_PLIES = 400
+_SETTINGS = {'name': str, 'time': float, 'nodes': int, 'depth': int, 'tt': int, 'eval': str}
+_RESULTS = {True: '1-0', False: '0-1', None: '1/2-1/2'}
+
+# The Searcher of each engine spec in a worker process, kept between games
+_worker_searchers = {}
+
+
+def parse_engine(text, defaults):
+    # Settings dict of an engine spec such as "name=new,nodes=5000", over the defaults
+    settings = dict(defaults)
+    for item in filter(None, text.split(',')):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key not in _SETTINGS or not value:
+            raise ValueError(f'bad engine setting: {item}')
+        settings[key] = _SETTINGS[key](value.strip())
+    return settings
+
+
+def _searcher(settings):
+    key = tuple(sorted(settings.items()))
+    if key not in _worker_searchers:
+        evaluation = None
+        if settings.get('eval'):
+            module, _, function = settings['eval'].partition(':')
+            evaluation = getattr(importlib.import_module(module), function or 'evaluate')
+        _worker_searchers[key] = engine.Searcher(tt_mb=settings['tt'], evaluation=evaluation)
+    return _worker_searchers[key]
+
+
+def opening(rng, fens, opening_book, book_plies, random_plies):
+    # (start position, opening moves): a start position, then book moves while there are any, then
+    # random legal moves. An opening that ends the game is drawn again.
+    while True:
+        start = pieces.Position.from_fen(rng.choice(fens)) if fens else pieces.Board()
+        position = start.copy()
+        moves = []
+        for _ in range(book_plies if opening_book else 0):
+            move = opening_book.choose(position, rng)
+            if move is None:
+                break
+            position.push(move)
+            moves.append(move)
+        for _ in range(random_plies):
+            legal = position.legal_moves()
+            if not legal:
+                break
+            move = rng.choice(legal)
+            position.push(move)
+            moves.append(move)
+        legal = position.legal_moves()
+        if game.outcome(position, legal, position.in_check()) is None:
+            return start, moves
+
+
+def schedule(rng, fens, opening_book, book_plies, random_plies):
+    # (game number, whether engine 1 has white, start position, opening moves) in playing order;
+    # the two games of a pair share an opening and swap colours
+    for pair in itertools.count():
+        start, moves = opening(rng, fens, opening_book, book_plies, random_plies)
+        yield 2 * pair, True, start, moves
+        yield 2 * pair + 1, False, start, moves
+
+
+def play_game(white, black, fen, opening_moves):
+    # Play one game in a worker; returns (result, moves after the opening, termination)
+    position = pieces.Position.from_fen(fen)
+    for move in opening_moves:
+        position.push(move)
+    searchers = {True: _searcher(white), False: _searcher(black)}
+    for searcher in searchers.values():
+        searcher.tt.clear()
+    moves = []
+    while True:
+        legal = position.legal_moves()
+        ended = game.outcome(position, legal, position.in_check())
+        if ended:
+            winner = not position.white_to_move if ended == game.CHECKMATE else None
+            return _RESULTS[winner], moves, ended
+        if len(opening_moves) + len(moves) >= MAX_PLIES:
+            return _RESULTS[None], moves, 'move limit'
+        settings = white if position.white_to_move else black
+        result = searchers[position.white_to_move].search(position, max_time=settings['time'],
+                                                          max_nodes=settings['nodes'], max_depth=settings['depth'])
+        position.push(result.move)
+        moves.append(result.move)
+
+
+def elo(score):
+    # Elo difference of an expected score in (0, 1)
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return 400 * math.log10(score / (1 - score))
+
+
+def _score_stats(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    return games, score, variance
+
+
+def elo_interval(wins, draws, losses, z=1.96):
+    # (Elo difference, half-width of its confidence interval, 95% by default) from the first
+    # engine's side
+    games, score, variance = _score_stats(wins, draws, losses)
+    margin = z * math.sqrt(variance / games)
+    low, high = elo(score - margin), elo(score + margin)
+    return elo(score), (high - low) / 2
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    # Log-likelihood ratio of H1 (difference elo1) over H0 (difference elo0), by the normal
+    # approximation to the score distribution
+    games, score, variance = _score_stats(wins, draws, losses)
+    if variance == 0:
+        return 0.0
+    score0, score1 = (1 / (1 + 10 ** (-value / 400)) for value in (elo0, elo1))
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprt_bounds(alpha, beta):
+    # (lower, upper) LLR bounds: below lower accepts H0, above upper accepts H1
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def report(names, wins, draws, losses, llr=None, bounds=None):
+    games = wins + draws + losses
+    difference, margin = elo_interval(wins, draws, losses)
+    line = (f'{names[0]} vs {names[1]}: {games} games  +{wins} ={draws} -{losses}  '
+            f'score {(wins + draws / 2) / games:.1%}  Elo {difference:+.1f} +/- {margin:.1f}')
+    if llr is not None:
+        line += f'  LLR {llr:.2f} [{bounds[0]:.2f}, {bounds[1]:.2f}]'
+    print(line, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engine1', default='', help='settings of the engine being tested')
+    parser.add_argument('--engine2', default='', help='settings of its opponent')
+    parser.add_argument('-g', '--games', type=int, default=100, help='most games to play, rounded up to pairs')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--time', type=float, help='seconds per move')
+    parser.add_argument('--nodes', type=int, help='nodes per move; 10000 when no limit is given')
+    parser.add_argument('--depth', type=int, default=engine.MAX_PLY)
+    parser.add_argument('--tt', type=int, default=16, help='transposition table MB per engine')
+    parser.add_argument('--openings', help='file of start positions, one FEN per line')
+    parser.add_argument('--book', help='opening book from book.py to play the first moves from')
+    parser.add_argument('--book-plies', type=int, default=12)
+    parser.add_argument('--random-plies', type=int, default=6, help='random moves after the book')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'),
+                        help='stop as soon as a difference of ELO1 (H1) or of ELO0 (H0) is accepted')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('-o', '--pgn', help='append the games to this PGN file')
+    args = parser.parse_args(argv)
+    if args.time is None and args.nodes is None and args.depth == engine.MAX_PLY:
+        args.nodes = 10000
+
+    defaults = {'time': args.time, 'nodes': args.nodes, 'depth': args.depth, 'tt': args.tt, 'eval': ''}
+    try:
+        engines = [parse_engine(args.engine1, dict(defaults, name='engine1')),
+                   parse_engine(args.engine2, dict(defaults, name='engine2'))]
+    except ValueError as error:
+        parser.error(str(error))
+    names = [settings['name'] for settings in engines]
+    if names[0] == names[1]:
+        names = [f'{names[0]}-1', f'{names[1]}-2']
+    fens = []
+    if args.openings:
+        with open(args.openings) as f:
+            fens = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    opening_book = book.open_book(args.book)
+    bounds = sprt_bounds(args.alpha, args.beta) if args.sprt else None
+    tasks = itertools.islice(schedule(random.Random(args.seed), fens, opening_book, args.book_plies,
+                                      args.random_plies), args.games + args.games % 2)
+    date = datetime.date.today().strftime('%Y.%m.%d')
+    output = open(args.pgn, 'a', encoding='utf-8') if args.pgn else None
+
+    def submit(pool):
+        # Start the next game, if any is left
+        for task in itertools.islice(tasks, 1):
+            _, first_white, start, moves = task
+            white, black = engines if first_white else engines[::-1]
+            pending[pool.submit(play_game, white, black, start.fen(), moves)] = task
+
+    wins = draws = losses = 0
+    llr = None
+    pending = {}
+    with ProcessPoolExecutor(args.workers) as pool:
+        # Two games queued per worker keep it busy while results are handled
+        for _ in range(2 * args.workers):
+            submit(pool)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                number, first_white, start, opening_moves = pending.pop(future)
+                result, moves, termination = future.result()
+                if result == '1/2-1/2':
+                    draws += 1
+                elif (result == '1-0') == first_white:
+                    wins += 1
+                else:
+                    losses += 1
+                if output:
+                    headers = {'Event': 'tournament', 'Site': 'local', 'Date': date, 'Round': number + 1,
+                               'White': names[0] if first_white else names[1],
+                               'Black': names[1] if first_white else names[0], 'Termination': termination}
+                    # A game from the standard start position carries no FEN tag
+                    standard = start.fen() == pieces.START_FEN
+                    output.write(pgn.write_game(opening_moves + moves, headers, result,
+                                                None if standard else start) + '\n')
+                if args.sprt:
+                    llr = sprt_llr(wins, draws, losses, *args.sprt)
+                submit(pool)
+            report(names, wins, draws, losses, llr, bounds)
+            if llr is not None and not bounds[0] < llr < bounds[1]:
+                # Decided: games not yet started are dropped, and those under way are left to finish
+                # unrecorded
+                pool.shutdown(cancel_futures=True)
+                accepted = 1 if llr >= bounds[1] else 0
+                print(f'SPRT: H{accepted} accepted, {names[0]} {args.sprt[accepted]:+g} Elo')
+                break
+    if output:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+from array import array
+
+# Bound types for stored search scores
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Bytes per slot across the parallel arrays: key 8, move 4, score 4, depth 1, flag 1, generation 1
+ENTRY_BYTES = 19
+
+
+class TranspositionTable:
+    # Fixed-size, array-backed table of search results keyed by Zobrist hash.
+    # Each key maps to one slot; a slot is overwritten when it is empty, holds the same position,
+    # was written in an earlier search, or the new result searched at least as deep.
+
+    def __init__(self, size_mb=16):
+        slots = 1
+        while slots * 2 * ENTRY_BYTES <= size_mb * 1024 * 1024:
+            slots *= 2
+        self.size = slots
+        self.mask = slots - 1
+        self.keys = array('Q', bytes(8 * slots))
+        self.moves = array('i', bytes(4 * slots))
+        self.scores = array('i', bytes(4 * slots))
+        self.depths = array('b', bytes(slots))
+        self.flags = array('B', bytes(slots))
+        self.generations = array('B', bytes(slots))
+        self.generation = 1
+
+    def new_search(self):
+        # Entries from earlier searches become the first to be replaced
+        self.generation = self.generation % 255 + 1
+
+    def clear(self):
+        for table in (self.keys, self.moves, self.scores, self.depths, self.flags, self.generations):
+            table[:] = array(table.typecode, bytes(table.itemsize * self.size))
+        self.generation = 1
+
+    def probe(self, key):
+        # (depth, score, flag, encoded move) stored for key, or None
+        slot = key & self.mask
+        if self.generations[slot] and self.keys[slot] == key:
+            return self.depths[slot], self.scores[slot], self.flags[slot], self.moves[slot]
+        return None
+
+    def store(self, key, depth, score, flag, move=0):
+        slot = key & self.mask
+        if self.generations[slot] == self.generation and self.keys[slot] != key and self.depths[slot] > depth:
+            return
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.scores[slot] = score
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.generations[slot] = self.generation